@@ -0,0 +1,258 @@
+import cProfile
+import json
+import os
+import re
+import resource
+import sys
+import time
+import tracemalloc
+
+PROFILE_MODES = ("tracemalloc", "cprofile")
+MB = 1024 * 1024
+
+_tracer = None
+
+
+class _NullSpan:
+    """Returned by ``span`` and ``run`` while tracing is off; every operation is a no-op."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def count(self, items=1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "path", "items", "start", "mem_start", "mem_peak")
+
+    def __init__(self, tracer, name, items):
+        self.tracer = tracer
+        self.name = name
+        self.items = items
+
+    def count(self, items=1):
+        self.items += items
+
+    def __enter__(self):
+        self.tracer._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._exit(self, exc_type)
+        return False
+
+
+class _Run(_Span):
+    """Root span of one file or collection; nested spans are aggregated into its stages."""
+    __slots__ = ("kind", "stages", "profiler", "rss_start")
+
+    def __init__(self, tracer, kind, name, items):
+        super().__init__(tracer, name, items)
+        self.kind = kind
+        self.stages = {}
+        self.profiler = None
+        self.rss_start = None
+
+
+def peak_rss_mb():
+    """Peak RSS of this process in MB.
+
+    On Linux this is VmHWM, which starts afresh at exec and in a forked child,
+    and which ``reset_peak_rss`` lowers to the current RSS. ru_maxrss, the
+    fallback elsewhere, carries the parent's size over into a child and never
+    drops, so a worker forked from a large parent would report its size.
+    """
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (MB if sys.platform == "darwin" else 1024)
+
+
+def rss_mb():
+    """Current RSS of this process in MB, or None where /proc is unavailable."""
+    return _proc_status_mb("VmRSS")
+
+
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Restarts VmHWM from the current RSS (Linux 4.0+); elsewhere the peak stays process-wide."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class Tracer:
+    """Times named stages and writes one JSON line per file or collection.
+
+    A ``run`` covers one unit of work; every ``span`` opened inside it is
+    aggregated by its path of enclosing span names (``extract_document/
+    extract_page``), with its call count, total seconds and the items it
+    reported. Nested spans are also counted in their parents' time. When a run
+    closes, its record is appended to ``path`` (stderr if None) with a single
+    write, so worker processes can share the file. The peak RSS is reset as
+    each run opens, so a record reports that run's own peak rather than the
+    largest run before it in the same process; ``rss_growth_mb`` is that peak
+    less the RSS the run started from.
+
+    ``profile="tracemalloc"`` adds the net and peak bytes Python allocated in
+    each stage; ``profile="cprofile"`` writes a cProfile dump per run to
+    ``profile_dir``. Both slow the work they measure.
+
+    Spans are tracked on one stack per process, so a tracer follows a single
+    thread of work; it is not meant for the threaded ranking service.
+    """
+
+    def __init__(self, path=None, profile=None, profile_dir="."):
+        if profile not in (None, *PROFILE_MODES):
+            raise ValueError(f"unknown profile mode '{profile}'")
+        self.path = path
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.stack = []
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644) if path else None
+        if profile == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def settings(self):
+        return {"path": self.path, "profile": self.profile, "profile_dir": self.profile_dir}
+
+    def span(self, name, items=0):
+        return _Span(self, name, items) if self.stack else _NULL_SPAN
+
+    def run(self, kind, name, items=0):
+        # A run inside another run is just one of its stages.
+        return _Run(self, kind, name, items) if not self.stack else _Span(self, kind, items)
+
+    def _enter(self, span):
+        span.path = f"{self.stack[-1].path}/{span.name}" if len(self.stack) > 1 else span.name
+        if isinstance(span, _Run):
+            span.path = ""
+            reset_peak_rss()
+            span.rss_start = rss_mb()
+            if self.profile == "cprofile":
+                span.profiler = cProfile.Profile()
+                span.profiler.enable()
+        else:
+            # Created on entry so stages are listed in the order they start.
+            self.stack[0].stages.setdefault(span.path, {"calls": 0, "seconds": 0.0, "items": 0})
+        if self.profile == "tracemalloc":
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1].mem_peak = max(self.stack[-1].mem_peak, peak)
+            tracemalloc.reset_peak()
+            span.mem_start = span.mem_peak = current
+        self.stack.append(span)
+        span.start = time.perf_counter()
+
+    def _exit(self, span, exc_type):
+        seconds = time.perf_counter() - span.start
+        self.stack.pop()
+        if self.profile == "tracemalloc":
+            current, peak = tracemalloc.get_traced_memory()
+            span.mem_peak = max(span.mem_peak, peak)
+            tracemalloc.reset_peak()
+            if self.stack:
+                self.stack[-1].mem_peak = max(self.stack[-1].mem_peak, span.mem_peak)
+        if isinstance(span, _Run):
+            self._emit(span, seconds, exc_type)
+            return
+        stage = self.stack[0].stages[span.path]
+        stage["calls"] += 1
+        stage["seconds"] += seconds
+        stage["items"] += span.items
+        if self.profile == "tracemalloc":
+            stage["alloc_mb"] = stage.get("alloc_mb", 0.0) + (current - span.mem_start) / MB
+            stage["peak_alloc_mb"] = max(stage.get("peak_alloc_mb", 0.0), (span.mem_peak - span.mem_start) / MB)
+
+    def _emit(self, run, seconds, exc_type):
+        peak = peak_rss_mb()
+        record = {
+            "kind": run.kind, "name": run.name, "pid": os.getpid(),
+            "status": "ok" if exc_type is None else exc_type.__name__,
+            "seconds": round(seconds, 6), "items": run.items, "peak_rss_mb": round(peak, 1),
+        }
+        if run.rss_start is not None:
+            record["rss_growth_mb"] = round(max(peak - run.rss_start, 0.0), 1)
+        if self.profile == "tracemalloc":
+            current, _ = tracemalloc.get_traced_memory()
+            record["alloc_mb"] = round((current - run.mem_start) / MB, 3)
+            record["peak_alloc_mb"] = round((run.mem_peak - run.mem_start) / MB, 3)
+        if run.profiler is not None:
+            run.profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            filename = re.sub(r"[^\w.-]+", "_", f"{run.kind}-{run.name}")
+            record["profile"] = os.path.join(self.profile_dir, f"{filename}.prof")
+            run.profiler.dump_stats(record["profile"])
+        record["stages"] = {
+            path: {key: round(value, 6) if isinstance(value, float) else value for key, value in stage.items()}
+            for path, stage in run.stages.items()
+        }
+        line = (json.dumps(record) + "\n").encode('utf-8')
+        if self.fd is None:
+            sys.stderr.write(line.decode('utf-8'))
+        else:
+            os.write(self.fd, line)
+
+
+def _after_fork():
+    # A forked worker inherits the parent's open runs but never closes them.
+    if _tracer is not None:
+        _tracer.stack = []
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def configure(path=None, profile=None, profile_dir="."):
+    """Turns tracing on, writing JSON lines to ``path``; with neither a path nor a profile mode, turns it off."""
+    global _tracer
+    _tracer = Tracer(path, profile, profile_dir) if path or profile else None
+    return _tracer
+
+
+def settings():
+    """Keyword arguments that make ``configure`` reproduce the current setup, e.g. in a worker process."""
+    return _tracer.settings() if _tracer is not None else {}
+
+
+def span(name, items=0):
+    """Context manager timing one stage of the current run; ``count()`` on it adds items."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, items)
+
+
+def run(kind, name, items=0):
+    """Context manager around one file or collection, emitting its record when it closes."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.run(kind, name, items)
+
+
+def add_trace_arguments(parser):
+    parser.add_argument("--trace", default=None,
+                        help="Append per-stage timings, one JSON line per file or collection, to this file.")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=None,
+                        help="Also record Python allocations per stage (tracemalloc) or dump a cProfile per run.")
+    parser.add_argument("--profile-dir", default="profiles", help="Where --profile cprofile writes its .prof files.")
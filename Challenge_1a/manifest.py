@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_digest(path):
+    """Hex SHA-256 of a file's content, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_digest(paths):
+    """Short digest of the given source files, used as the version of the tool built from them."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class Manifest:
+    """Records the inputs each output was built from, so unchanged work can be skipped.
+
+    An entry holds the content hash, size and mtime of every input file, plus
+    the tool version and parameters used. An output is current when its file
+    still exists and the hashes, tool and parameters all match. Files are
+    re-hashed only when their size or mtime changed since they were recorded,
+    so a file that was only touched is re-hashed and still counts as
+    unchanged. Challenge 1a keeps one entry per PDF, Challenge 1b one per
+    collection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.entries = data.get("entries", {}) if data.get("version") == MANIFEST_VERSION else {}
+
+    def fingerprint(self, key, paths):
+        """Maps each name in ``paths`` to its hash, size and mtime (None if missing)."""
+        previous = self.entries.get(key, {}).get("inputs", {})
+        inputs = {}
+        for name, path in paths.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                inputs[name] = None
+                continue
+            recorded = previous.get(name)
+            if recorded and recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+                digest = recorded["sha256"]
+            else:
+                digest = file_digest(path)
+            inputs[name] = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        return inputs
+
+    def is_current(self, key, inputs, tool, params, output_path):
+        entry = self.entries.get(key)
+        if entry is None or entry["tool"] != tool or entry["params"] != params or not os.path.exists(output_path):
+            return False
+
+        def hashes(files):
+            return {name: info and info["sha256"] for name, info in files.items()}
+        return hashes(entry["inputs"]) == hashes(inputs)
+
+    def record(self, key, inputs, tool, params):
+        self.entries[key] = {"inputs": inputs, "tool": tool, "params": params}
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, indent=4)
+        os.replace(tmp_path, self.path)
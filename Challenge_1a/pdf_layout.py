@@ -0,0 +1,318 @@
+import json
+import os
+import re
+from collections import namedtuple
+from itertools import groupby
+
+import fitz
+import numpy as np
+
+from instrumentation import span
+from manifest import file_digest
+
+LAYOUT_VERSION = 2
+LAYOUT_SUFFIX = ".layout.npz"
+# Text only: with images kept, turning the image blocks into dicts costs
+# more than extracting the text itself.
+EXTRACT_FLAGS = fitz.TEXTFLAGS_TEXT
+
+LayoutLine = namedtuple("LayoutLine", ["block", "line", "text", "size", "bold", "bbox"])
+
+
+class PageLayout:
+    """Compact span table for one page, built from a single dict extraction.
+
+    Each row of ``lines`` is a text line with its joined span text, the rounded
+    size and bold flag of its first span, the bbox of the enclosing block and
+    its block/line ids in sorted reading order. ``block_count`` counts text
+    blocks only; see ``image_block_count`` for the rest.
+    """
+    __slots__ = ("number", "width", "height", "block_count", "lines", "is_toc")
+
+    def __init__(self, number, width, height, block_count, lines, is_toc):
+        self.number = number
+        self.width = width
+        self.height = height
+        self.block_count = block_count
+        self.lines = lines
+        self.is_toc = is_toc
+
+    @classmethod
+    def from_blocks(cls, page, blocks):
+        """Builds the layout of ``page`` from its unsorted get_text("dict") blocks."""
+        lines = []
+        # Same (bottom, left) order as get_text(sort=True).
+        for block_id, block in enumerate(sorted(blocks, key=lambda b: (b["bbox"][3], b["bbox"][0]))):
+            if "lines" in block:
+                bbox = tuple(block["bbox"])
+                for line_id, line in enumerate(block["lines"]):
+                    if "spans" in line and line["spans"]:
+                        span = line["spans"][0]
+                        lines.append(LayoutLine(
+                            block_id, line_id, "".join(s["text"] for s in line["spans"]),
+                            round(span["size"]), "bold" in span["font"].lower(), bbox
+                        ))
+        return cls(page.number, page.rect.width, page.rect.height, len(blocks), lines,
+                   is_toc_page(page, (line.text for line in lines)))
+
+    def blocks(self):
+        """Yields (block bbox, lines) for every text block on the page."""
+        for _, group in groupby(self.lines, key=lambda ln: ln.block):
+            group = list(group)
+            yield group[0].bbox, group
+
+
+def read_blocks(page):
+    return page.get_text("dict", flags=EXTRACT_FLAGS)["blocks"]
+
+
+def image_block_count(page):
+    """Image blocks a default get_text("dict") lists for ``page``, which EXTRACT_FLAGS leaves out.
+
+    This pays for the image extraction, so it is only meant for the odd page
+    whose total block count matters.
+    """
+    return sum(1 for block in page.get_text("dict")["blocks"] if block["type"] == 1)
+
+
+def is_toc_page(page, line_texts):
+    # Only pages whose lines mention "contents" pay for the plain-text
+    # extraction, whose line breaks the TOC heuristic is defined on.
+    if not any("contents" in text.lower() for text in line_texts):
+        return False
+    with span("is_toc_page"):
+        toc_text = page.get_text().lower()
+        if "table of contents" in toc_text:
+            lines = toc_text.split('\n')
+            toc_lines = [line for line in lines if re.search(r'\d+\s*$', line)]
+            if len(toc_lines) > 5:
+                return True
+        return False
+
+
+class DocumentLayout:
+    """Every block and line of a PDF from one text page per page.
+
+    This is the layout both challenges work from: Challenge 1a reads sorted
+    per-page views (``page_layout``) to find the title and outline, and
+    Challenge 1b reads heading candidates and positioned lines
+    (``block_heads``, ``page_lines``) to cut sections. Text blocks and their
+    lines are kept in PyMuPDF's own order in parallel NumPy columns; line
+    texts share one string buffer addressed by offsets. The dict lines and the
+    plain get_text() blocks come from the same text page, and
+    ``line_in_text`` marks the lines whose texts make up the page text.
+
+    ``meta`` carries the source PDF's SHA-256, its bookmarks and metadata
+    title, and, once Challenge 1a has processed it, the title and outline
+    with each heading's y position. ``save``/``load`` persist all of it as one
+    ``.npz`` artifact, so a PDF is parsed once across both stages.
+    """
+
+    def __init__(self):
+        self.meta = {"version": LAYOUT_VERSION}
+        self._pages = []
+        self._blocks = []
+        self._lines = []
+        self._texts = []
+        self._heads = []
+
+    @classmethod
+    def extract(cls, doc, source=None):
+        layout = cls()
+        layout.meta["source"] = source
+        layout.meta["toc"] = doc.get_toc(simple=True)
+        layout.meta["metadata_title"] = (doc.metadata or {}).get("title", "")
+        for page in doc:
+            layout.add_page(page)
+        return layout.freeze()
+
+    def add_page(self, page):
+        number = len(self._pages)
+        line_texts = []
+        with span("extract_page") as stage:
+            textpage = page.get_textpage(flags=EXTRACT_FLAGS)
+            # get_text()'s own text of each block. The dict leaves out some
+            # lines, such as vertical ones, that plain text keeps.
+            plain = {b[5]: b for b in textpage.extractBLOCKS() if b[6] == 0}
+            for block in textpage.extractDICT()["blocks"]:
+                lines = block.get("lines", [])
+                self._blocks.append((number, "lines" in block, *block["bbox"]))
+                # Heading text of a block: its first line, spans joined by spaces.
+                self._heads.append(" ".join(s["text"] for s in lines[0]["spans"]) if lines else "")
+                first = len(self._lines)
+                for line in lines:
+                    spans = line.get("spans") or []
+                    text = "".join(s["text"] for s in spans)
+                    if spans:
+                        size, bold = round(spans[0]["size"]), "bold" in spans[0]["font"].lower()
+                        line_texts.append(text)
+                    else:
+                        size, bold = -1, False
+                    self._lines.append((len(self._blocks) - 1, *line["bbox"], size, bold, True))
+                    self._texts.append(text)
+                if "lines" in block:
+                    self._match_plain_text(first, plain.get(block["number"]))
+            stage.count(len(line_texts))
+            self._pages.append((page.rect.width, page.rect.height, is_toc_page(page, line_texts)))
+
+    def _match_plain_text(self, first, plain):
+        """Makes the page text of the block whose lines start at ``first`` its get_text() text.
+
+        Where the dict lines differ, they leave the page text and the plain
+        text becomes one unstyled line spanning the block.
+        """
+        x0, y0, x1, y1, text = plain[:5] if plain else (0, 0, 0, 0, "")
+        if "".join(t + "\n" for t in self._texts[first:] if t) == text:
+            return
+        self._lines[first:] = [line[:-1] + (False,) for line in self._lines[first:]]
+        self._lines.append((len(self._blocks) - 1, x0, y0, x1, y1, -1, False, True))
+        self._texts.append(text.removesuffix("\n"))
+
+    def freeze(self):
+        pages = self._pages
+        self.page_size = np.array([p[:2] for p in pages], dtype=np.float64).reshape(-1, 2)
+        self.page_is_toc = np.array([p[2] for p in pages], dtype=bool)
+        self.block_page = np.array([b[0] for b in self._blocks], dtype=np.int32)
+        self.block_is_text = np.array([b[1] for b in self._blocks], dtype=bool)
+        self.block_bbox = np.array([b[2:] for b in self._blocks], dtype=np.float64).reshape(-1, 4)
+        self.line_block = np.array([ln[0] for ln in self._lines], dtype=np.int32)
+        self.line_bbox = np.array([ln[1:5] for ln in self._lines], dtype=np.float64).reshape(-1, 4)
+        self.line_size = np.array([ln[5] for ln in self._lines], dtype=np.int32)
+        self.line_bold = np.array([ln[6] for ln in self._lines], dtype=bool)
+        self.line_in_text = np.array([ln[7] for ln in self._lines], dtype=bool)
+        self._set_text(self._texts, self._heads)
+        del self._pages, self._blocks, self._lines, self._texts, self._heads
+        return self._index()
+
+    def _set_text(self, texts, heads):
+        self.text = "".join(texts)
+        self.offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=self.offsets[1:])
+        self.heads = "".join(heads)
+        self.head_offsets = np.zeros(len(heads) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in heads], out=self.head_offsets[1:])
+
+    def _index(self):
+        pages = np.arange(len(self.page_size) + 1)
+        self.page_blocks = np.searchsorted(self.block_page, pages)
+        self.block_lines = np.searchsorted(self.line_block, np.arange(len(self.block_page) + 1))
+        return self
+
+    @property
+    def page_count(self):
+        return len(self.page_size)
+
+    def line_text(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def block_head(self, b):
+        return self.heads[self.head_offsets[b]:self.head_offsets[b + 1]]
+
+    def _sorted_blocks(self, number):
+        start, end = self.page_blocks[number], self.page_blocks[number + 1]
+        bbox = self.block_bbox[start:end].tolist()
+        return [start + b for b in sorted(range(end - start), key=lambda b: (bbox[b][3], bbox[b][0]))]
+
+    def page_layout(self, number):
+        """The sorted per-page view Challenge 1a's heuristics read; see PageLayout."""
+        lines = []
+        for block_id, b in enumerate(self._sorted_blocks(number)):
+            bbox = tuple(self.block_bbox[b].tolist())
+            for line_id, i in enumerate(range(self.block_lines[b], self.block_lines[b + 1])):
+                if self.line_size[i] >= 0:
+                    lines.append(LayoutLine(block_id, line_id, self.line_text(i), int(self.line_size[i]),
+                                            bool(self.line_bold[i]), bbox))
+        width, height = self.page_size[number].tolist()
+        block_count = int(self.page_blocks[number + 1] - self.page_blocks[number])
+        return PageLayout(number, width, height, block_count, lines, bool(self.page_is_toc[number]))
+
+    def _page_line_range(self, number):
+        blocks = self.page_blocks
+        return range(self.block_lines[blocks[number]], self.block_lines[blocks[number + 1]])
+
+    def page_styles(self, number):
+        """(size, bold) of the first span of every non-empty line, in page order."""
+        return [(int(self.line_size[i]), bool(self.line_bold[i]))
+                for i in self._page_line_range(number) if self.line_size[i] >= 0]
+
+    def page_lines(self, number):
+        """(top y, text + newline) of every line in page order; joined they give the page text."""
+        lines = self._page_line_range(number)
+        top = self.line_bbox[lines.start:lines.stop, 1].tolist()
+        return [(y, self.line_text(i) + "\n") for i, y in zip(lines, top)
+                if self.line_in_text[i] and self.offsets[i] < self.offsets[i + 1]]
+
+    def page_text(self, number):
+        return "".join(text for _, text in self.page_lines(number))
+
+    def block_heads(self, number):
+        """Heading candidates: (size, bold, top y, first line text, line count) per text block, in reading order."""
+        heads = []
+        for b in self._sorted_blocks(number):
+            first = self.block_lines[b]
+            if self.block_is_text[b] and first < self.block_lines[b + 1] and self.line_size[first] >= 0:
+                heads.append((int(self.line_size[first]), bool(self.line_bold[first]), float(self.block_bbox[b][1]),
+                              self.block_head(b).strip(), int(self.block_lines[b + 1] - first)))
+        return heads
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in (
+            "page_size", "page_is_toc", "block_page", "block_is_text", "block_bbox",
+            "line_block", "line_bbox", "line_size", "line_bold", "line_in_text",
+        )}
+        lengths = {"text_lengths": np.diff(self.offsets), "head_lengths": np.diff(self.head_offsets)}
+        encoded = {
+            name: np.frombuffer(value.encode('utf-8'), dtype=np.uint8)
+            for name, value in (("meta", json.dumps(self.meta)), ("text", self.text), ("heads", self.heads))
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays, **lengths, **encoded)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode('utf-8'))
+            if meta.get("version") != LAYOUT_VERSION:
+                raise ValueError(f"layout artifact '{path}' has version {meta.get('version')}")
+            layout = cls.__new__(cls)
+            layout.meta = meta
+            for name in ("page_size", "page_is_toc", "block_page", "block_is_text", "block_bbox",
+                         "line_block", "line_bbox", "line_size", "line_bold", "line_in_text"):
+                setattr(layout, name, data[name])
+            text, heads = data["text"].tobytes().decode('utf-8'), data["heads"].tobytes().decode('utf-8')
+            text_lengths, head_lengths = data["text_lengths"], data["head_lengths"]
+        layout.text, layout.heads = text, heads
+        layout.offsets = np.concatenate(([0], np.cumsum(text_lengths))).astype(np.int64)
+        layout.head_offsets = np.concatenate(([0], np.cumsum(head_lengths))).astype(np.int64)
+        return layout._index()
+
+
+def layout_path(layout_dir, digest):
+    return os.path.join(layout_dir, digest + LAYOUT_SUFFIX)
+
+
+def load_or_extract(pdf_path, layout_dir=None, save=True):
+    """The PDF's layout, read from ``layout_dir`` when cached there.
+
+    Artifacts are named by the PDF's SHA-256, so a renamed file still hits
+    and an edited one misses. A miss is extracted and, with a ``layout_dir``
+    and ``save``, stored for the next reader.
+    """
+    if layout_dir is None:
+        with fitz.open(pdf_path) as doc:
+            return DocumentLayout.extract(doc)
+    digest = file_digest(pdf_path)
+    path = layout_path(layout_dir, digest)
+    try:
+        with span("load_layout"):
+            return DocumentLayout.load(path)
+    except (OSError, ValueError, KeyError):
+        pass
+    with fitz.open(pdf_path) as doc:
+        layout = DocumentLayout.extract(doc, source=digest)
+    if save:
+        layout.save(path)
+    return layout
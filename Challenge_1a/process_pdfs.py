@@ -1,69 +1,216 @@
+import argparse
 import fitz
 import json
+import multiprocessing
+import numpy as np
 import os
 import re
+import resource
+import signal
+import time
 from collections import Counter, defaultdict
+from functools import partial
+from multiprocessing.connection import wait
+from itertools import chain
 from pathlib import Path
 
+import instrumentation
+from instrumentation import span
+from manifest import MANIFEST_FILE, Manifest, file_digest
+from pdf_layout import (
+    DocumentLayout, PageLayout, image_block_count, layout_path, load_or_extract, read_blocks,
+)
+
 INPUT_DIR = Path("/app/input")
 OUTPUT_DIR = Path("/app/output")
+STORE_SHRINK_INTERVAL = 100
+BOOKMARK_SAMPLE_SIZE = 3
+BOOKMARK_MIN_OVERLAP = 0.5
+BOOKMARK_MAX_START_FRACTION = 0.25
+# How long past --timeout a worker may run before it is killed: the in-process
+# alarm cannot interrupt a call stuck inside MuPDF's C code.
+KILL_GRACE_SECONDS = 5.0
+NUMBERED_HEADING_RE = re.compile(r"^\d\.(\d(\.\d)?)?")
+
+class SpanTable:
+    """Columnar line table for a whole document.
+
+    One row per text line in sorted reading order, with the rounded size and
+    bold flag of its first span, the top y of its block, and its page and block
+    ids held in parallel NumPy arrays. Line texts share a single string buffer
+    addressed by ``offsets``; a block's lines are contiguous, so
+    ``text[offsets[i]:offsets[j]]`` is the joined text of rows i..j-1.
+    Per-page height and TOC flags are kept alongside for page-level masks.
+
+    The rows are the lines of every page's ``DocumentLayout.page_layout``,
+    gathered straight from the layout's columns.
+    """
+
+    def __init__(self, layout):
+        # Blocks in (page, bottom, left) order; ties keep PyMuPDF's order, as
+        # the stable per-page sort in DocumentLayout does.
+        bbox = layout.block_bbox
+        order = np.lexsort((bbox[:, 0], bbox[:, 3], layout.block_page))
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order)) - layout.page_blocks[layout.block_page[order]]
+
+        # Each block's lines, in block order, minus lines without spans.
+        first, last = layout.block_lines[order], layout.block_lines[order + 1]
+        counts = last - first
+        rows = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rows = rows[layout.line_size[rows] >= 0]
+
+        blocks = layout.line_block[rows]
+        self.page = layout.block_page[blocks].astype(np.int32)
+        self.block = rank[blocks]
+        self.size = layout.line_size[rows].astype(np.int32)
+        self.bold = layout.line_bold[rows].astype(bool)
+        self.y = bbox[blocks, 1].astype(np.float64)
+        texts = [layout.line_text(i) for i in rows.tolist()]
+        self.offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=self.offsets[1:])
+        self.text = "".join(texts)
+        self.page_height = layout.page_size[:, 1].astype(np.float64)
+        self.page_is_toc = layout.page_is_toc.astype(bool)
+
+    def __len__(self):
+        return len(self.size)
+
+    def style_codes(self):
+        """Encodes each row's (size, bold) style as one integer, size * 2 + bold."""
+        return self.size.astype(np.int64) * 2 + self.bold
+
+    @staticmethod
+    def decode_style(code):
+        return int(code) // 2, bool(code % 2)
+
+    def block_starts(self):
+        """Row index of the first line of every block, plus the end sentinel."""
+        key = self.page.astype(np.int64) << 32 | self.block
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.zeros(0, dtype=np.int64)
+        return starts, np.r_[starts[1:], len(key)]
+
 
 class PdfProcessor:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, use_bookmarks=True, layout=None):
         self.pdf_path = pdf_path
-        self.doc = fitz.open(pdf_path)
+        with span("open"):
+            self.doc = fitz.open(pdf_path)
+        self.layout = layout
         self.title = ""
         self.outline = []
         self.font_styles = defaultdict(int)
-        self._profile_document()
+        self.first_page = None
+        self.spans = None
+        self.outline_source = "layout"
+        with span("read_bookmarks"):
+            from_bookmarks = use_bookmarks and self._read_bookmarks()
+        if from_bookmarks:
+            self.outline_source = "bookmarks"
+        else:
+            with span("profile_document") as stage:
+                self._profile_document()
+                stage.count(sum(self.font_styles.values()))
+
+    def _read_bookmarks(self):
+        """Takes title and outline from the PDF's own bookmarks and metadata.
+
+        The bookmark tree is trusted only if its levels nest properly, its target
+        pages exist, are in reading order and start near the front, and a sample
+        of entries actually appear on their target pages. Returns False to fall back to layout
+        heuristics.
+        """
+        toc = self.doc.get_toc(simple=True)
+        # A tree that only starts deep into the document covers part of it at best.
+        if not toc or toc[0][2] - 1 > len(self.doc) * BOOKMARK_MAX_START_FRACTION:
+            return False
+
+        prev_level, prev_page = 0, 1
+        for level, text, page in toc:
+            if level > prev_level + 1 or not prev_page <= page <= len(self.doc) or not text.strip():
+                return False
+            prev_level, prev_page = level, page
+
+        entries = [(level, text.strip(), page - 1) for level, text, page in toc if level <= 3]
+        step = max(1, len(entries) // BOOKMARK_SAMPLE_SIZE)
+        for _, text, page in entries[::step][:BOOKMARK_SAMPLE_SIZE]:
+            page_words = set(re.findall(r"\w+", self.doc[page].get_text().lower()))
+            words = re.findall(r"\w+", text.lower())
+            if not words or sum(w in page_words for w in words) / len(words) < BOOKMARK_MIN_OVERLAP:
+                return False
+
+        title = (self.doc.metadata or {}).get("title", "").strip()
+        if re.search(r"\.\w{2,4}$", title) or title.lower().startswith("microsoft word"):
+            title = ""
+        self.title = title or self._first_page_title()
+
+        seen_text = {title} if title else set()
+        for level, text, page in entries:
+            if text not in seen_text:
+                self.outline.append({"level": f"H{level}", "text": text, "page": page})
+                seen_text.add(text)
+        return True
+
+    def _first_page_title(self):
+        """The title the layout heuristics find, read from the first page alone."""
+        if self.layout is not None:
+            layout = self.layout.page_layout(0)
+        else:
+            layout = PageLayout.from_blocks(self.doc[0], read_blocks(self.doc[0]))
+        if len(self.doc) > 1:
+            return self._detect_title(layout.lines)
+        candidates, is_poster_like = self._single_page_candidates(layout)
+        return candidates[0]["text"] if candidates and not is_poster_like else ""
 
     def _profile_document(self):
-        for page in self.doc:
-            blocks = page.get_text("dict", sort=True)["blocks"]
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        if "spans" in line and line["spans"]:
-                            size = round(line["spans"][0]["size"])
-                            bold = "bold" in line["spans"][0]["font"].lower()
-                            self.font_styles[(size, bold)] += 1
+        if self.layout is None:
+            self.layout = DocumentLayout.extract(self.doc)
+        if self.layout.page_count:
+            self.first_page = self.layout.page_layout(0)
+        self.spans = SpanTable(self.layout)
+
+        codes, first_index, counts = np.unique(self.spans.style_codes(), return_index=True, return_counts=True)
+        # Most frequent style wins; ties go to the style seen first.
+        for i in np.argsort(first_index, kind="stable"):
+            self.font_styles[self.spans.decode_style(codes[i])] = int(counts[i])
         
         if self.font_styles:
-            sorted_styles = sorted(self.font_styles.items(), key=lambda item: item[1], reverse=True)
-            self.body_text_style = sorted_styles[0][0]
+            self.body_text_style = self.spans.decode_style(codes[np.lexsort((first_index, -counts))[0]])
         else:
             self.body_text_style = (12, False)
 
     def extract_title_and_headings(self):
+        if self.outline_source == "bookmarks":
+            return
         if len(self.doc) == 1:
             self._process_single_page_doc()
         else:
             self._process_multi_page_doc()
 
+    def _single_page_candidates(self, layout):
+        """Non-empty lines of a one-page document, top first, and whether the page looks like a poster."""
+        page_width = layout.width
+
+        # Images count as blocks here, as they did before extraction went text-only.
+        is_poster_like = layout.block_count + image_block_count(self.doc[0]) < 25
+
+        candidates = []
+        for line in layout.lines:
+            text = line.text.strip()
+            if text:
+                h_center = (line.bbox[0] + line.bbox[2]) / 2
+                is_centered = abs(h_center - page_width / 2) < page_width * 0.20
+                candidates.append({"text": text, "size": line.size, "y": line.bbox[1], "centered": is_centered})
+
+        candidates.sort(key=lambda x: x["y"])
+        return candidates, is_poster_like
+
     def _process_single_page_doc(self):
-        page = self.doc[0]
-        blocks = page.get_text("dict", sort=True)["blocks"]
-        page_width = page.rect.width
         body_size = self.body_text_style[0]
-        
-        is_poster_like = len(blocks) < 25
+        candidates, is_poster_like = self._single_page_candidates(self.first_page)
 
-        candidates = []
-        for block in blocks:
-            if "lines" in block:
-                for line in block["lines"]:
-                    if "spans" in line and line["spans"]:
-                        text = "".join(s["text"] for s in line["spans"]).strip()
-                        if text:
-                            size = round(line["spans"][0]["size"])
-                            h_center = (block['bbox'][0] + block['bbox'][2]) / 2
-                            is_centered = abs(h_center - page_width / 2) < page_width * 0.20
-                            candidates.append({"text": text, "size": size, "y": block["bbox"][1], "centered": is_centered})
-        
         if not candidates: return
-        
-        candidates.sort(key=lambda x: x["y"])
-        
+
         if is_poster_like:
             self.title = ""
             candidates.sort(key=lambda x: x["size"], reverse=True)
@@ -82,148 +229,523 @@ class PdfProcessor:
                 heading_candidates.sort(key=lambda x: x["size"], reverse=True)
                 self.outline.append({"level": "H1", "text": heading_candidates[0]["text"], "page": 0})
 
-    def _is_toc_page(self, page):
-        toc_text = page.get_text().lower()
-        if "table of contents" in toc_text:
-            lines = toc_text.split('\n')
-            toc_lines = [line for line in lines if re.search(r'\d+\s*$', line)]
-            if len(toc_lines) > 5:
-                return True
-        return False
-
-    def _process_multi_page_doc(self):
-        first_page_blocks = self.doc[0].get_text("dict", sort=True)["blocks"]
+    def _detect_title(self, first_page_lines):
         max_font_size = 0
         title_candidates = []
-        if first_page_blocks:
-            for block in first_page_blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        if "spans" in line and line["spans"]:
-                           max_font_size = max(max_font_size, round(line["spans"][0]["size"]))
+        if first_page_lines:
+            max_font_size = max(line.size for line in first_page_lines)
             
             seen_titles = set()
-            for block in first_page_blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        if "spans" in line and line["spans"] and round(line["spans"][0]["size"]) >= max_font_size * 0.95:
-                            line_text = "".join(span["text"] for span in line["spans"]).strip()
-                            if line_text and line_text not in seen_titles:
-                                title_candidates.append((block["bbox"][1], line_text))
-                                seen_titles.add(line_text)
+            for line in first_page_lines:
+                if line.size >= max_font_size * 0.95:
+                    line_text = line.text.strip()
+                    if line_text and line_text not in seen_titles:
+                        title_candidates.append((line.bbox[1], line_text))
+                        seen_titles.add(line_text)
         
         title_candidates.sort(key=lambda x: x[0])
-        self.title = " ".join(item[1] for item in title_candidates)
+        return " ".join(item[1] for item in title_candidates)
 
-        candidates = []
+    def _process_multi_page_doc(self):
+        self.title = self._detect_title(self.first_page.lines)
+        spans = self.spans
         body_size, body_bold = self.body_text_style
-        for page_num, page in enumerate(self.doc):
-            if page_num == 0 or self._is_toc_page(page): 
-                continue
 
-            page_height = page.rect.height
-            margin_y = page_height * 0.10
-            
-            blocks = page.get_text("dict", sort=True)["blocks"]
-            for block in blocks:
-                if "lines" in block and margin_y < block["bbox"][1] < (page_height - margin_y):
-                    line_text = "".join(span["text"] for line in block["lines"] for span in line["spans"]).strip()
-                    if not line_text: continue
-
-                    span = block["lines"][0]["spans"][0]
-                    f_size, f_bold = round(span["size"]), "bold" in span["font"].lower()
-                    
-                    is_heading_style = (f_size > body_size) or (f_bold and not body_bold)
-                    is_table_header = "version date remarks" in line_text.lower()
-                    
-                    if is_heading_style and not is_table_header and line_text.lower() not in self.title.lower():
-                        candidates.append({
-                            "text": line_text, "style": (f_size, f_bold), "page": page_num, "y": block["bbox"][1]
-                        })
-        
+        starts, ends = spans.block_starts()
+        page, y = spans.page[starts], spans.y[starts]
+        size, bold = spans.size[starts], spans.bold[starts]
+        page_height = spans.page_height[page]
+        margin_y = page_height * 0.10
+
+        mask = (page != 0) & ~spans.page_is_toc[page] & (margin_y < y) & (y < page_height - margin_y)
+        mask &= (size > body_size) | (bold & (not body_bold))
+
+        title = self.title.lower()
+        keep, texts = [], []
+        for i in np.flatnonzero(mask):
+            line_text = spans.text[spans.offsets[starts[i]]:spans.offsets[ends[i]]].strip()
+            if line_text and "version date remarks" not in line_text.lower() and line_text.lower() not in title:
+                keep.append(i)
+                texts.append(line_text)
+        keep = np.array(keep, dtype=np.int64)
+
+        # 0 for unnumbered text, else the depth of its "1.", "1.1" or "1.1.1" prefix.
+        numbering = np.array([self._numbering_depth(text) for text in texts], dtype=np.int8)
+        styles = spans.style_codes()[starts[keep]]
+
         style_map = {}
-        for cand in candidates:
-            text = cand["text"]
-            if re.match(r"^\d\.\d", text):
-                if "H2" not in style_map: style_map["H2"] = cand["style"]
-            elif re.match(r"^\d\.", text):
-                if "H1" not in style_map: style_map["H1"] = cand["style"]
+        h2 = np.flatnonzero(numbering >= 2)
+        h1 = np.flatnonzero(numbering == 1)
+        # Levels go in in the order their first numbered heading appears: when
+        # H1 and H2 share a style, the later one claims its unnumbered headings.
+        firsts = [(matches[0], level) for level, matches in (("H2", h2), ("H1", h1)) if len(matches)]
+        for first, level in sorted(firsts):
+            style_map[level] = styles[first]
 
         if not style_map:
-            heading_styles = sorted(list(set(c["style"] for c in candidates)), key=lambda s: s[0], reverse=True)
+            _, first_index = np.unique(styles, return_index=True)
+            first_seen = set(spans.decode_style(styles[i]) for i in np.sort(first_index))
+            heading_styles = sorted(list(first_seen), key=lambda s: s[0], reverse=True)
             for i, style in enumerate(heading_styles[:3]):
-                style_map[f"H{i+1}"] = style
+                style_map[f"H{i+1}"] = style[0] * 2 + style[1]
 
-        level_map = {style: level for level, style in style_map.items()}
+        levels = numbering.astype(np.int8)
+        for level, code in style_map.items():
+            levels[(numbering == 0) & (styles == code)] = int(level[1])
 
-        for cand in candidates:
-            level = None
-            text, style = cand["text"], cand["style"]
-            
-            if re.match(r"^\d\.\d\.\d", text): level = "H3"
-            elif re.match(r"^\d\.\d", text): level = "H2"
-            elif re.match(r"^\d\.", text): level = "H1"
-            elif style in level_map: level = level_map[style]
-            
-            if level:
-                self.outline.append({
-                    "level": level, "text": text, "page": cand["page"], "y": cand["y"]
-                })
+        for i in np.flatnonzero(levels):
+            self.outline.append({
+                "level": f"H{levels[i]}", "text": texts[i], "page": int(page[keep[i]]), "y": float(y[keep[i]])
+            })
 
-    def process(self):
-        self.extract_title_and_headings()
-        self.outline.sort(key=lambda x: (x.get("page", 0), x.get("y", 0)))
-        
-        final_outline = []
-        if self.outline:
-            current_heading = self.outline[0]
-            for i in range(1, len(self.outline)):
-                next_heading = self.outline[i]
-                if (next_heading["page"] == current_heading["page"] and
-                    re.match(r"^\d\.", current_heading["text"]) and not re.match(r"^\d\.", next_heading["text"])):
-                     current_heading["text"] += next_heading["text"]
-                else:
-                    final_outline.append(current_heading)
-                    current_heading = next_heading
-            final_outline.append(current_heading)
-
-            seen_text = set()
-            deduped_outline = []
-            for item in final_outline:
-                text_key = item["text"].strip()
+    @staticmethod
+    def _numbering_depth(text):
+        match = NUMBERED_HEADING_RE.match(text)
+        if not match:
+            return 0
+        return 1 + (match.group(1) is not None) + (match.group(2) is not None)
+
+    @staticmethod
+    def _merge_outline(outline):
+        """Merges split numbered headings and drops repeats, in (page, y) order.
+
+        Consumes ``outline`` lazily so it can be fed from a page generator.
+        """
+        current_heading = None
+        seen_text = set()
+        for next_heading in chain(outline, [None]):
+            if (current_heading is not None and next_heading is not None and
+                next_heading["page"] == current_heading["page"] and
+                re.match(r"^\d\.", current_heading["text"]) and not re.match(r"^\d\.", next_heading["text"])):
+                 current_heading["text"] += next_heading["text"]
+                 continue
+            if current_heading is not None:
+                text_key = current_heading["text"].strip()
                 if text_key and text_key not in seen_text:
-                    item.pop("y", None)
-                    deduped_outline.append(item)
                     seen_text.add(text_key)
-            self.outline = deduped_outline
+                    yield current_heading
+            current_heading = next_heading
+
+    def process(self):
+        with span("classify_headings") as stage:
+            self.extract_title_and_headings()
+            stage.count(len(self.outline))
+        if self.outline_source == "bookmarks":
+            return
+        with span("merge_outline"):
+            self.outline.sort(key=lambda x: (x.get("page", 0), x.get("y", 0)))
+            self.outline = list(self._merge_outline(self.outline))
+
+    @staticmethod
+    def _output_entry(item):
+        return {"level": item["level"], "text": item["text"].strip() + " ", "page": item["page"]}
 
     def to_json(self):
         title = self.title.strip()
-        for item in self.outline:
-            item["text"] = item["text"].strip() + " "
-            
         return {
             "title": f"{title} " if title else "",
-            "outline": self.outline
+            "outline": [self._output_entry(item) for item in self.outline]
         }
 
-def main():
-    if not OUTPUT_DIR.exists():
-        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    def record_outline(self):
+        """Stores the title and outline, headings' y positions included, in the document layout."""
+        self.layout.meta.update({
+            "title": self.title, "outline_source": self.outline_source,
+            "outline": [dict(item, y=item.get("y")) for item in self.outline],
+        })
+
+class StreamingPdfProcessor(PdfProcessor):
+    """Bounded-memory variant of PdfProcessor for very long documents.
+
+    Instead of caching every page's layout, the document is walked twice as a
+    page generator: a profiling pass that keeps only per-style counters, and an
+    outline pass that classifies, merges and dedups headings page by page and
+    writes them straight to the output JSON. Peak memory no longer grows with
+    page count, at the cost of extracting each page twice. Output is identical
+    to PdfProcessor.
+    """
+
+    def _iter_layouts(self):
+        for page in self.doc:
+            with span("extract_page") as stage:
+                layout = PageLayout.from_blocks(page, read_blocks(page))
+                stage.count(len(layout.lines))
+            # Periodically drop MuPDF's cached fonts/resources so they don't
+            # accumulate with page count.
+            if page.number % STORE_SHRINK_INTERVAL == STORE_SHRINK_INTERVAL - 1:
+                fitz.TOOLS.store_shrink(100)
+            yield layout
 
-    for pdf_file in INPUT_DIR.glob("*.pdf"):
-        print(f"Processing {pdf_file.name}...")
+    def _profile_document(self):
+        # style -> [first candidate index, first "1.1" index, first "1." index]
+        self.style_stats = {}
+        index = 0
+        for layout in self._iter_layouts():
+            for line in layout.lines:
+                self.font_styles[(line.size, line.bold)] += 1
+            if layout.number == 0:
+                self.first_page = layout
+                self.title = self._detect_title(layout.lines)
+                continue
+            if layout.is_toc:
+                continue
+            for text, style, _ in self._page_blocks(layout):
+                stats = self.style_stats.setdefault(style, [index, None, None])
+                depth = self._numbering_depth(text)
+                if depth >= 2:
+                    if stats[1] is None: stats[1] = index
+                elif depth == 1:
+                    if stats[2] is None: stats[2] = index
+                index += 1
+
+        if self.font_styles:
+            sorted_styles = sorted(self.font_styles.items(), key=lambda item: item[1], reverse=True)
+            self.body_text_style = sorted_styles[0][0]
+        else:
+            self.body_text_style = (12, False)
+
+    def _page_blocks(self, layout):
+        """Yields (text, style, y) for body-area blocks that may be headings.
+
+        Everything but the comparison against the body style is applied here,
+        so callers that do not know the body style yet can still collect stats.
+        """
+        page_height = layout.height
+        margin_y = page_height * 0.10
+        
+        for bbox, lines in layout.blocks():
+            if margin_y < bbox[1] < (page_height - margin_y):
+                line_text = "".join(line.text for line in lines).strip()
+                if not line_text: continue
+
+                is_table_header = "version date remarks" in line_text.lower()
+                if not is_table_header and line_text.lower() not in self.title.lower():
+                    yield line_text, (lines[0].size, lines[0].bold), bbox[1]
+
+    def _is_heading_style(self, style):
+        body_size, body_bold = self.body_text_style
+        f_size, f_bold = style
+        return (f_size > body_size) or (f_bold and not body_bold)
+
+    def _heading_level(self, text, style, level_map):
+        depth = self._numbering_depth(text)
+        if depth:
+            return f"H{depth}"
+        return level_map.get(style)
+
+    def _level_map(self):
+        heading_stats = [(style, stats) for style, stats in self.style_stats.items() if self._is_heading_style(style)]
+        style_map = {}
+        firsts = []
+        for level, slot in (("H2", 1), ("H1", 2)):
+            matches = [(stats[slot], style) for style, stats in heading_stats if stats[slot] is not None]
+            if matches:
+                firsts.append((*min(matches), level))
+        # As in PdfProcessor, the level whose first numbered heading comes later
+        # wins a style shared by H1 and H2.
+        for _, style, level in sorted(firsts):
+            style_map[level] = style
+
+        if not style_map:
+            # Insert in first-seen order so set iteration, and hence tie order
+            # in the size sort, matches the in-memory processor.
+            first_seen = set(style for _, style in sorted((stats[0], style) for style, stats in heading_stats))
+            heading_styles = sorted(list(first_seen), key=lambda s: s[0], reverse=True)
+            for i, style in enumerate(heading_styles[:3]):
+                style_map[f"H{i+1}"] = style
+
+        return {style: level for level, style in style_map.items()}
+
+    def _iter_headings(self):
+        level_map = self._level_map()
+        for layout in self._iter_layouts():
+            if layout.number == 0 or layout.is_toc:
+                continue
+            page_headings = []
+            for text, style, y in self._page_blocks(layout):
+                if self._is_heading_style(style):
+                    level = self._heading_level(text, style, level_map)
+                    if level:
+                        page_headings.append({"level": level, "text": text, "page": layout.number, "y": y})
+            page_headings.sort(key=lambda x: x["y"])
+            yield from page_headings
+
+    def iter_outline(self):
+        if self.outline_source == "bookmarks":
+            return iter(self.outline)
+        if len(self.doc) == 1:
+            self._process_single_page_doc()
+            return iter(self.outline)
+        return self._merge_outline(self._iter_headings())
+
+    def write_json(self, output_filename):
+        """Writes the same JSON as ``json.dump(to_json(), indent=4)``, one outline entry at a time."""
+        outline = self.iter_outline()
+        title = self.title.strip()
+        with open(output_filename, 'w', encoding='utf-8') as f:
+            f.write('{\n    "title": ')
+            f.write(json.dumps(f"{title} " if title else "", ensure_ascii=False))
+            f.write(',\n    "outline": [')
+            count = 0
+            for item in outline:
+                entry = json.dumps(self._output_entry(item), indent=4, ensure_ascii=False).replace("\n", "\n        ")
+                f.write(("," if count else "") + "\n        " + entry)
+                count += 1
+            f.write("\n    ]\n}" if count else "]\n}")
+        return count
+
+
+def tool_version():
+    """Content hash of this script and the layout module plus the PyMuPDF version, so code or library changes invalidate outputs."""
+    here = Path(__file__).resolve().parent
+    digests = ".".join(file_digest(here / name)[:12] for name in ("process_pdfs.py", "pdf_layout.py"))
+    return f"{digests}+pymupdf-{fitz.VersionBind}"
+
+
+class ProcessingTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ProcessingTimeout()
+
+
+def _limit_memory(max_memory_mb):
+    if max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _init_worker(max_memory_mb, trace_settings):
+    _limit_memory(max_memory_mb)
+    instrumentation.configure(**trace_settings)
+
+
+def _worker_loop(conn, task, max_memory_mb, trace_settings):
+    _init_worker(max_memory_mb, trace_settings)
+    for pdf_file in iter(conn.recv, None):
+        conn.send(task(pdf_file))
+
+
+class _Worker:
+    """A worker process fed one file at a time over its own pipe.
+
+    Unlike a shared executor queue, the parent always knows which file a
+    worker holds and since when, so a worker that crashes or overruns can be
+    killed and replaced without losing the other workers' files.
+    """
+
+    def __init__(self, context, task, max_memory_mb, trace_settings):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, daemon=True,
+                                       args=(child_conn, task, max_memory_mb, trace_settings))
+        self.process.start()
+        child_conn.close()
+        self.pdf_file = None
+        self.deadline = None
+
+    def send(self, pdf_file, timeout):
+        self.pdf_file = pdf_file
+        self.deadline = time.monotonic() + timeout + KILL_GRACE_SECONDS if timeout else None
+        self.conn.send(pdf_file)
+
+    def receive(self):
+        """The finished file's result, or None if the worker died first."""
         try:
-            processor = PdfProcessor(pdf_file)
-            processor.process()
-            output_data = processor.to_json()
-
-            output_filename = OUTPUT_DIR / f"{pdf_file.stem}.json"
-            with open(output_filename, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, indent=4, ensure_ascii=False)
-            print(f"Successfully generated {output_filename.name}")
-        except Exception as e:
-            print(f"Error processing {pdf_file.name}: {e}")
+            if self.conn.poll():
+                result = self.conn.recv()
+                self.pdf_file = self.deadline = None
+                return result
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def close(self, kill=False):
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                kill = True
+        if kill:
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _run_workers(pdf_files, task, workers, timeout, max_memory_mb, report):
+    """Runs ``task`` on each file across ``workers`` processes, reporting each result as it arrives.
+
+    A worker that dies (a segfault, the OOM killer) fails only the file it
+    was on, and one still busy ``KILL_GRACE_SECONDS`` past ``timeout`` is
+    killed and its file reported as timed out; either way a fresh worker
+    takes over the remaining files.
+    """
+    context = multiprocessing.get_context()
+    trace_settings = instrumentation.settings()
+    pending = list(reversed(pdf_files))
+    pool = [_Worker(context, task, max_memory_mb, trace_settings) for _ in range(min(workers, len(pdf_files)))]
+    try:
+        while True:
+            for worker in pool:
+                if worker.pdf_file is None and pending:
+                    worker.send(pending.pop(), timeout)
+            busy = [worker for worker in pool if worker.pdf_file is not None]
+            if not busy:
+                break
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            wait_seconds = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            wait([worker.conn for worker in busy] + [worker.process.sentinel for worker in busy], wait_seconds)
+            for worker in busy:
+                result = worker.receive()
+                if result is not None:
+                    report(*result)
+                    continue
+                name = worker.pdf_file.name
+                if not worker.process.is_alive():
+                    worker.close(kill=True)
+                    code = worker.process.exitcode
+                    cause = f"killed by signal {-code}" if code < 0 else f"exit code {code}"
+                    report(name, "failure", f"Error processing {name}: worker died ({cause})")
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    worker.close(kill=True)
+                    report(name, "timeout", f"Timed out processing {name} after {timeout}s (worker killed)")
+                else:
+                    continue
+                pool[pool.index(worker)] = _Worker(context, task, max_memory_mb, trace_settings)
+    finally:
+        for worker in pool:
+            worker.close(kill=worker.pdf_file is not None)
+
+
+def process_file(pdf_file, output_dir, timeout=None, stream=False, use_bookmarks=True, layout_dir=None):
+    """Processes one PDF and writes its JSON, returning (name, status, message).
+
+    Status is one of "success", "failure" or "timeout"; errors never propagate
+    so a single bad file cannot take down the batch. With ``layout_dir`` (not
+    in streaming mode) the document layout is read from or saved to that
+    directory, together with the outline found, for Challenge 1b to reuse.
+    With tracing configured, the file's stage timings are emitted as one run.
+    """
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        output_filename = Path(output_dir) / f"{pdf_file.stem}.json"
+        with instrumentation.run("file", pdf_file.name) as record:
+            if stream:
+                processor = StreamingPdfProcessor(pdf_file, use_bookmarks=use_bookmarks)
+                with span("write_json"):
+                    entries = processor.write_json(output_filename)
+                record.count(entries)
+            else:
+                layout = load_or_extract(pdf_file, layout_dir, save=False) if layout_dir else None
+                processor = PdfProcessor(pdf_file, use_bookmarks=use_bookmarks, layout=layout)
+                processor.process()
+                output_data = processor.to_json()
+                record.count(len(output_data["outline"]))
+                if layout_dir:
+                    with span("save_layout"):
+                        processor.record_outline()
+                        layout.save(layout_path(layout_dir, layout.meta["source"]))
+
+                with span("write_json"), open(output_filename, 'w', encoding='utf-8') as f:
+                    json.dump(output_data, f, indent=4, ensure_ascii=False)
+        return pdf_file.name, "success", f"Successfully generated {output_filename.name} ({processor.outline_source})"
+    except ProcessingTimeout:
+        return pdf_file.name, "timeout", f"Timed out processing {pdf_file.name} after {timeout}s"
+    except MemoryError:
+        return pdf_file.name, "failure", f"Error processing {pdf_file.name}: memory limit exceeded"
+    except Exception as e:
+        return pdf_file.name, "failure", f"Error processing {pdf_file.name}: {e}"
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def run_batch(input_dir, output_dir, workers=1, timeout=None, max_memory_mb=None, stream=False,
+              use_bookmarks=True, force=False, layout_dir=None):
+    """Processes every PDF in ``input_dir`` whose output is missing or stale.
+
+    A manifest in ``output_dir`` records what each output was built from; a
+    PDF is skipped when its content, this script and the options that shape
+    the output are all unchanged since its JSON was written, unless ``force``.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    task = partial(process_file, output_dir=output_dir, timeout=timeout, stream=stream,
+                   use_bookmarks=use_bookmarks, layout_dir=layout_dir)
+    manifest = Manifest(output_dir / MANIFEST_FILE)
+    tool = tool_version()
+    params = {"stream": stream, "use_bookmarks": use_bookmarks}
+    counts = Counter()
+
+    pdf_files, fingerprints = [], {}
+    for pdf_file in sorted(input_dir.glob("*.pdf")):
+        inputs = manifest.fingerprint(pdf_file.name, {pdf_file.name: pdf_file})
+        layout_missing = layout_dir and not stream and not os.path.exists(
+            layout_path(layout_dir, inputs[pdf_file.name]["sha256"]))
+        if not force and not layout_missing and manifest.is_current(
+                pdf_file.name, inputs, tool, params, output_dir / f"{pdf_file.stem}.json"):
+            manifest.record(pdf_file.name, inputs, tool, params)
+            counts["skipped"] += 1
+        else:
+            pdf_files.append(pdf_file)
+            fingerprints[pdf_file.name] = inputs
+    for name in set(manifest.entries) - {p.name for p in input_dir.glob("*.pdf")}:
+        manifest.discard(name)
+    if counts["skipped"]:
+        print(f"Skipping {counts['skipped']} unchanged files (use --force to reprocess them).")
+
+    def report(name, status, message):
+        counts[status] += 1
+        if status == "success":
+            manifest.record(name, fingerprints[name], tool, params)
+        else:
+            manifest.discard(name)
+        print(message)
+
+    try:
+        if workers <= 1:
+            _limit_memory(max_memory_mb)
+            for pdf_file in pdf_files:
+                print(f"Processing {pdf_file.name}...")
+                report(*task(pdf_file))
+        else:
+            print(f"Processing {len(pdf_files)} files with {workers} workers...")
+            _run_workers(pdf_files, task, workers, timeout, max_memory_mb, report)
+    finally:
+        manifest.save()
+
+    print(f"Done: {counts['success']} succeeded, {counts['failure']} failed, {counts['timeout']} timed out, "
+          f"{counts['skipped']} skipped as unchanged.")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract title and H1/H2/H3 outline from PDFs.")
+    parser.add_argument("--input-dir", type=Path, default=INPUT_DIR)
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (1 processes files serially in-process).")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Per-file timeout in seconds.")
+    parser.add_argument("--max-memory-mb", type=int, default=None,
+                        help="Address-space cap per worker process, in MB.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Use bounded-memory streaming extraction (for very long documents).")
+    parser.add_argument("--no-bookmarks", dest="use_bookmarks", action="store_false",
+                        help="Always use layout heuristics, even when the PDF has a usable bookmark tree.")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess every PDF, even those unchanged since the last run.")
+    parser.add_argument("--layout-dir", type=Path, default=None,
+                        help="Save each PDF's layout and outline here for Challenge 1b to reuse (not with --stream).")
+    instrumentation.add_trace_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args.trace, args.profile, args.profile_dir)
+
+    run_batch(args.input_dir, args.output_dir, workers=args.workers,
+              timeout=args.timeout, max_memory_mb=args.max_memory_mb, stream=args.stream,
+              use_bookmarks=args.use_bookmarks, force=args.force,
+              layout_dir=args.layout_dir)
 
 if __name__ == "__main__":
     main()
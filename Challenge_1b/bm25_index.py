@@ -0,0 +1,181 @@
+import hashlib
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+FORMAT_VERSION = 3
+DIGEST_SIZE = 16
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class TermCounts:
+    """Term counts and a digest of each document, gathered as documents are stored.
+
+    Terms are interned into one vocabulary, so document ``i`` is just
+    ``term_ids[offsets[i]:offsets[i + 1]]`` with the matching ``freqs``. An
+    index over any subset of the documents is then assembled from these
+    arrays, and fingerprinted from the digests, without their text.
+    """
+
+    def __init__(self, texts=()):
+        self.vocabulary = {}
+        self.term_ids = array('i')
+        self.freqs = array('i')
+        self.offsets = array('q', [0])
+        self.digests = bytearray()
+        for text in texts:
+            self.add(text)
+
+    def add(self, text):
+        counts = Counter(tokenize(text))
+        vocabulary = self.vocabulary
+        self.term_ids.extend(array('i', (vocabulary.setdefault(term, len(vocabulary)) for term in counts)))
+        self.freqs.extend(array('i', counts.values()))
+        self.offsets.append(len(self.term_ids))
+        self.digests += hashlib.blake2b(text.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+    def extend(self, other):
+        """Appends every document of ``other``."""
+        vocabulary = self.vocabulary
+        remap = array('i', (vocabulary.setdefault(term, len(vocabulary)) for term in other.vocabulary))
+        base = self.offsets[-1]
+        self.term_ids.extend(array('i', (remap[t] for t in other.term_ids)))
+        self.freqs.extend(other.freqs)
+        self.offsets.extend(array('q', (base + offset for offset in other.offsets[1:])))
+        self.digests += other.digests
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def fingerprint(self, docs):
+        """Hash identifying the exact document list ``docs`` an index is built from."""
+        digests = np.frombuffer(self.digests, dtype=np.uint8).reshape(-1, DIGEST_SIZE)
+        digest = hashlib.sha256(f"bm25-v{FORMAT_VERSION}".encode('utf-8'))
+        digest.update(digests[np.asarray(docs, dtype=np.int64)].tobytes())
+        return digest.hexdigest()
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index held in CSR-style NumPy arrays.
+
+    Postings for term ``t`` are ``doc_ids[indptr[t]:indptr[t + 1]]`` with the
+    matching ``term_freqs``. The index is saved as one ``.npz`` file together
+    with a fingerprint of the documents, so a stale file is never reused. The
+    vocabulary is saved as one UTF-8 buffer plus term lengths, like a
+    DocumentLayout's text, since a fixed-width string array pads every term to
+    the longest one.
+    """
+
+    def __init__(self, vocabulary, indptr, doc_ids, term_freqs, doc_lengths, fingerprint, k1=1.5, b=0.75):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.fingerprint = fingerprint
+        self.k1 = k1
+        self.b = b
+        self._term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self._avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        document_freqs = np.diff(indptr)
+        self._idf = np.log((len(doc_lengths) - document_freqs + 0.5) / (document_freqs + 0.5) + 1.0)
+
+    @classmethod
+    def build(cls, texts):
+        counts = TermCounts(texts)
+        return cls.from_counts(counts, range(len(counts)))
+
+    @classmethod
+    def from_counts(cls, counts, docs):
+        """Index over documents ``docs`` of a TermCounts; document ``docs[j]`` becomes ``j``."""
+        offsets = np.frombuffer(counts.offsets, dtype=np.int64)
+        docs = np.asarray(docs, dtype=np.int64)
+        starts, sizes = offsets[docs], offsets[docs + 1] - offsets[docs]
+        # Positions of every selected posting, document by document.
+        shifts = starts - np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        positions = np.arange(int(sizes.sum()), dtype=np.int64) + np.repeat(shifts, sizes)
+        terms = np.frombuffer(counts.term_ids, dtype=np.int32)[positions]
+        freqs = np.frombuffer(counts.freqs, dtype=np.int32)[positions]
+        doc_column = np.repeat(np.arange(len(docs), dtype=np.int32), sizes)
+
+        used, local = np.unique(terms, return_inverse=True)
+        names = list(counts.vocabulary)
+        words = [names[t] for t in used.tolist()]
+        by_word = sorted(range(len(words)), key=words.__getitem__)
+        sorted_ids = np.empty(len(words), dtype=np.int64)
+        sorted_ids[by_word] = np.arange(len(words))
+        term_column = sorted_ids[local]
+        order = np.argsort(term_column, kind='stable')
+        indptr = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_column, minlength=len(words)), out=indptr[1:])
+        lengths = np.bincount(doc_column, weights=freqs, minlength=len(docs))
+        return cls(
+            [words[i] for i in by_word], indptr, doc_column[order], freqs[order],
+            lengths.astype(np.int32), counts.fingerprint(docs),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            terms = data["vocabulary"].tobytes().decode('utf-8')
+            ends = np.cumsum(data["term_lengths"]).tolist()
+            vocabulary = [terms[start:end] for start, end in zip([0] + ends, ends)]
+            return cls(
+                vocabulary, data["indptr"], data["doc_ids"], data["term_freqs"],
+                data["doc_lengths"], str(data["fingerprint"]),
+            )
+
+    @classmethod
+    def load_or_build(cls, path, counts, docs):
+        """Loads the index at ``path`` if it covers documents ``docs`` of ``counts``, else rebuilds and saves it.
+
+        Returns the index and whether it came from disk.
+        """
+        expected = counts.fingerprint(docs)
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.fingerprint == expected:
+                    return index, True
+            except (OSError, ValueError, KeyError):
+                pass
+        index = cls.from_counts(counts, docs)
+        if path:
+            index.save(path)
+        return index, False
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, vocabulary=np.frombuffer("".join(self.vocabulary).encode('utf-8'), dtype=np.uint8),
+                term_lengths=np.array([len(term) for term in self.vocabulary], dtype=np.int32), indptr=self.indptr,
+                doc_ids=self.doc_ids, term_freqs=self.term_freqs, doc_lengths=self.doc_lengths,
+                fingerprint=np.array(self.fingerprint),
+            )
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def scores(self, query):
+        """BM25 score of every document for ``query``."""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float64)
+        if not self._avg_length:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / self._avg_length)
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            ids, tf = self.doc_ids[start:end], self.term_freqs[start:end]
+            scores[ids] += self._idf[term_id] * tf * (self.k1 + 1) / (tf + norm[ids])
+        return scores
@@ -0,0 +1,118 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# The title prefix may take at most this share of a chunk's token budget; a
+# longer one is cut so every window still has room for content.
+MAX_PREFIX_FRACTION = 0.5
+
+# Encode texts of one section, their token counts, and how many of the
+# section's content tokens exist in total and fall inside the model window.
+Chunks = namedtuple("Chunks", ["texts", "lengths", "total", "seen"])
+
+
+def _plain_tokenizer(tokenizer):
+    """A copy of a fast tokenizer's ``tokenizers.Tokenizer`` with truncation and padding off, or None.
+
+    The encoder's own tokenizer keeps whatever truncation its last batch set,
+    which would cap the counts here at the model window.
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", tokenizer)
+    if not hasattr(backend, "to_str"):
+        return None
+    from tokenizers import Tokenizer
+
+    plain = Tokenizer.from_str(backend.to_str())
+    plain.no_truncation()
+    plain.no_padding()
+    return plain
+
+
+class SectionChunker:
+    """Splits section text into token-budgeted windows for the encoder.
+
+    Without ``max_tokens`` every section stays one text, as before, and the
+    model silently truncates anything beyond its window; ``split`` still
+    reports how much of the content that window covers. With ``max_tokens``
+    the content is cut into consecutive windows that each fit the budget
+    together with the title prefix, so the whole section is seen; no window
+    exceeds ``max_tokens``, as a prefix longer than ``MAX_PREFIX_FRACTION``
+    of it is cut short.
+
+    Tokens come from the model's fast tokenizer when it has one (the
+    ``tokenizers`` backend of a Hugging Face tokenizer, or the bare one an
+    OnnxEncoder loads); otherwise words and punctuation are counted as an
+    approximation.
+    """
+
+    def __init__(self, model, max_tokens=None, aggregate="max"):
+        if aggregate not in ("max", "mean"):
+            raise ValueError(f"unknown chunk aggregation '{aggregate}'")
+        self._tokenizer = _plain_tokenizer(getattr(model, "tokenizer", None))
+        max_seq_length = getattr(model, "max_seq_length", None)
+        if max_seq_length:
+            specials = self._tokenizer.num_special_tokens_to_add(False) if self._tokenizer is not None else 2
+            self.limit = max_seq_length - specials
+        else:
+            self.limit = float("inf")
+        self.max_tokens = min(max_tokens, self.limit) if max_tokens else None
+        self.aggregate = aggregate
+
+    def token_spans(self, text):
+        """Character (start, end) offsets of each token in ``text``."""
+        if self._tokenizer is not None:
+            return self._tokenizer.encode(text, add_special_tokens=False).offsets
+        return [m.span() for m in TOKEN_RE.finditer(text)]
+
+    def count_tokens(self, text):
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return sum(1 for _ in TOKEN_RE.finditer(text))
+
+    def split(self, prefix, content, measure=True):
+        """Encoder texts for ``prefix + content``, see ``Chunks``.
+
+        Without ``max_tokens`` nothing needs tokenizing but the coverage
+        statistics; ``measure=False`` skips them and reports no tokens.
+        """
+        if self.max_tokens is None:
+            if not measure:
+                return Chunks([prefix + content], [None], 0, 0)
+            prefix_tokens = self.count_tokens(prefix)
+            total = self.count_tokens(content)
+            room = max(0, self.limit - prefix_tokens)
+            return Chunks([prefix + content], [prefix_tokens + total], total, min(total, room))
+
+        prefix_spans = self.token_spans(prefix)
+        prefix_tokens = min(len(prefix_spans), int(self.max_tokens * MAX_PREFIX_FRACTION))
+        if prefix_tokens < len(prefix_spans):
+            prefix = prefix[:prefix_spans[prefix_tokens - 1][1]] + " " if prefix_tokens else ""
+        room = max(0, self.limit - prefix_tokens)
+        spans = self.token_spans(content)
+        total = len(spans)
+        if total == 0:
+            return Chunks([prefix + content], [prefix_tokens], 0, 0)
+
+        budget = self.max_tokens - prefix_tokens
+        texts, lengths, seen = [], [], 0
+        for start in range(0, total, budget):
+            window = spans[start:start + budget]
+            texts.append(prefix + content[window[0][0]:window[-1][1]])
+            lengths.append(prefix_tokens + len(window))
+            seen += min(len(window), room)
+        return Chunks(texts, lengths, total, seen)
+
+    def reduce(self, scores, chunk_counts):
+        """Folds (queries, chunks) scores into (queries, sections) by max or mean.
+
+        Each section's chunks must be contiguous and in section order.
+        """
+        counts = np.asarray(chunk_counts)
+        if scores.shape[1] == len(counts):
+            return scores
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        if self.aggregate == "max":
+            return np.maximum.reduceat(scores, starts, axis=1)
+        return np.add.reduceat(scores, starts, axis=1) / counts
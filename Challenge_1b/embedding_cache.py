@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """On-disk, content-addressed cache of section embeddings.
+
+    Vectors live in one memory-mapped array (``vectors.bin``), one row per
+    slot; ``index.json`` maps each key to its slot and last-use tick. Keys hash
+    the model id together with the text, so a model or library upgrade never
+    serves stale vectors. When the file would exceed ``max_bytes`` the least
+    recently used entries are evicted and their slots reused.
+
+    The cache assumes a single writer process at a time.
+    """
+
+    INDEX_FILE = "index.json"
+    VECTORS_FILE = "vectors.bin"
+
+    def __init__(self, directory, model_id, dim, dtype="float32", max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.model_id = model_id
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.max_slots = max(1, max_bytes // (dim * self.dtype.itemsize))
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._free = []
+        self._tick = 0
+        self._vectors = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _vectors_path(self):
+        return os.path.join(self.directory, self.VECTORS_FILE)
+
+    def _load(self):
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+
+        if not index or index.get("dim") != self.dim or index.get("dtype") != self.dtype.name:
+            # Missing, corrupt or incompatible: start over.
+            self._entries, self._tick, capacity = {}, 0, 0
+        else:
+            self._entries = {key: tuple(value) for key, value in index["entries"].items()}
+            self._tick = index["tick"]
+            capacity = index["capacity"]
+
+        self._open(capacity)
+        used = set(slot for slot, _ in self._entries.values())
+        self._free = [slot for slot in range(capacity - 1, -1, -1) if slot not in used]
+
+    def _open(self, capacity):
+        self._vectors = None
+        path = self._vectors_path()
+        size = capacity * self.dim * self.dtype.itemsize
+        with open(path, 'ab') as f:
+            f.truncate(size)
+        if capacity:
+            self._vectors = np.memmap(path, dtype=self.dtype, mode='r+', shape=(capacity, self.dim))
+
+    @property
+    def capacity(self):
+        return 0 if self._vectors is None else self._vectors.shape[0]
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode('utf-8')).hexdigest()
+
+    def _allocate(self, count, protected):
+        """Returns ``count`` free slots, growing the file or evicting LRU entries."""
+        if len(self._free) < count and self.capacity < self.max_slots:
+            old = self.capacity
+            new = min(self.max_slots, max(old * 2, old + count - len(self._free), 1024))
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._open(new)
+            self._free[:0] = range(new - 1, old - 1, -1)
+
+        if len(self._free) < count:
+            evictable = sorted(
+                (tick, key) for key, (slot, tick) in self._entries.items() if key not in protected
+            )
+            for _, key in evictable[:count - len(self._free)]:
+                self._free.append(self._entries.pop(key)[0])
+            # Persist the eviction before the slots are overwritten, so a crash
+            # cannot leave the on-disk index pointing at someone else's vector.
+            self.save()
+
+        count = min(count, len(self._free))
+        return [self._free.pop() for _ in range(count)]
+
+    def contains(self, text):
+        return self.key(text) in self._entries
+
+    def get_many(self, texts):
+        """Looks texts up, returning (vectors, missing positions).
+
+        Rows for missing texts are left as zeros for the caller to fill in.
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        self._tick += 1
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            entry = self._entries.get(key)
+            if entry is None:
+                missing.append(i)
+                continue
+            slot, _ = entry
+            self._entries[key] = (slot, self._tick)
+            vectors[i] = self._vectors[slot]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def put_many(self, texts, vectors):
+        keys = [self.key(text) for text in texts]
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self._entries]
+        slots = dict(zip(new_keys, self._allocate(len(new_keys), protected=set(keys))))
+        self._tick += 1
+        for key, vector in zip(keys, vectors):
+            if key in slots:
+                self._vectors[slots[key]] = vector
+        for key, slot in slots.items():
+            self._entries[key] = (slot, self._tick)
+
+    def save(self):
+        if self._vectors is not None:
+            self._vectors.flush()
+        index = {
+            "model_id": self.model_id, "dim": self.dim, "dtype": self.dtype.name,
+            "capacity": self.capacity, "tick": self._tick,
+            "entries": {key: list(value) for key, value in self._entries.items()},
+        }
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path())
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
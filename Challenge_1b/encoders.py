@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# file_digest comes from Challenge 1a's manifest module, as in main.py; this
+# module also runs on its own (export, check), so it puts it on the path too.
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Challenge_1a")
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+from manifest import file_digest
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_ONNX_DIR = "onnx_model"
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+ENCODER_CONFIG = "encoder.json"
+
+
+def cos_sim(a, b):
+    """Cosine similarities (rows of a x rows of b) in float32, like sentence_transformers.util.cos_sim."""
+    a = np.atleast_2d(np.asarray(a, dtype=np.float32))
+    b = np.atleast_2d(np.asarray(b, dtype=np.float32))
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return a @ b.T
+
+
+class OnnxEncoder:
+    """Sentence encoder running an exported transformer graph on ONNX Runtime.
+
+    Tokenization, pooling and normalization follow the sentence-transformers
+    model it was exported from (see ``export_onnx``), so it is a drop-in for
+    the subset of the SentenceTransformer API the pipeline uses. The exported
+    ``tokenizer.json`` is read with the ``tokenizers`` package, so neither
+    torch, transformers nor sentence-transformers is imported.
+    """
+
+    def __init__(self, directory, backend="onnx", threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError(f"the '{backend}' backend needs onnxruntime (pip install onnxruntime)") from None
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, ENCODER_CONFIG), encoding='utf-8') as f:
+            self.config = json.load(f)
+        path = os.path.join(directory, ONNX_FILES[backend])
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.max_seq_length = self.config["max_seq_length"]
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        pad_token = _special_token(directory, "pad_token")
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token), pad_token=pad_token)
+        self.backend = backend
+        self.encoder_id = f"{self.config['source']}@{backend}-{file_digest(path)[:12]}"
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feed = {name: inputs[name] for name in self.input_names}
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, convert_to_tensor=False,
+               show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        dimension = self.get_sentence_embedding_dimension()
+        embeddings = np.zeros((len(texts), dimension), dtype=np.float32)
+        # Longest first, as sentence-transformers does, keeps padding per batch small.
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([texts[i] for i in batch])
+        if single:
+            embeddings = embeddings[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embeddings)
+        return embeddings
+
+
+def _special_token(directory, name):
+    """A special token's text from the ``special_tokens_map.json`` that save_pretrained writes."""
+    with open(os.path.join(directory, "special_tokens_map.json"), encoding='utf-8') as f:
+        token = json.load(f)[name]
+    return token["content"] if isinstance(token, dict) else token
+
+
+def export_onnx(model_name, directory=DEFAULT_ONNX_DIR, quantize=True):
+    """Exports a sentence-transformers model's transformer to ONNX, plus an int8 copy.
+
+    ``model_name`` is resolved like SentenceTransformer does, so with
+    HF_HUB_OFFLINE=1 this only reads the model files already on disk.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if not model.tokenizer.is_fast:
+        raise ValueError(f"'{model_name}' has no fast tokenizer, which the ONNX backends need")
+    transformer = model[0].auto_model.eval()
+    pooling = next((m for m in model if isinstance(m, Pooling)), None)
+    mode = pooling.get_pooling_mode_str() if pooling is not None else "mean"
+    if mode not in ("mean", "cls"):
+        raise ValueError(f"unsupported pooling mode '{mode}' for ONNX export")
+
+    os.makedirs(directory, exist_ok=True)
+    inputs = model.tokenizer(["A sample sentence for tracing the graph."], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in inputs]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    path = os.path.join(directory, ONNX_FILES["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(inputs[n] for n in input_names), path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=14, dynamo=False)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, os.path.join(directory, ONNX_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+
+    # A fast tokenizer also saves the tokenizer.json that OnnxEncoder reads.
+    model.tokenizer.save_pretrained(directory)
+    with open(os.path.join(directory, ENCODER_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump({
+            "source": model_name,
+            "max_seq_length": model.max_seq_length,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "pooling": mode,
+            "normalize": any(isinstance(m, Normalize) for m in model),
+        }, f, indent=4)
+    return directory
+
+
+def load_encoder(backend, model_name, onnx_dir=DEFAULT_ONNX_DIR, threads=None):
+    """Loads the encoder for ``backend``, exporting the ONNX graphs first if they are missing."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown encoder backend '{backend}'")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if not os.path.exists(os.path.join(onnx_dir, ONNX_FILES[backend])):
+        print(f"No exported model in '{onnx_dir}', exporting '{model_name}'...")
+        export_onnx(model_name, onnx_dir)
+    return OnnxEncoder(onnx_dir, backend, threads)
+
+
+def encoder_id(model, model_name):
+    """Identifies the model and backend that produced an embedding, for cache keys."""
+    identifier = getattr(model, "encoder_id", None)
+    if identifier:
+        return identifier
+    import sentence_transformers
+    return f"{model_name}@sentence-transformers-{sentence_transformers.__version__}"
+
+
+def backend_id(backend, model_name, onnx_dir=DEFAULT_ONNX_DIR):
+    """Like ``encoder_id`` but without loading the model, for deciding whether outputs are stale."""
+    if backend == "torch":
+        from importlib.metadata import version
+        return f"{model_name}@sentence-transformers-{version('sentence-transformers')}"
+    path = os.path.join(onnx_dir, ONNX_FILES[backend])
+    return f"{model_name}@{backend}-{file_digest(path)[:12] if os.path.exists(path) else 'unexported'}"
+
+
+def check_parity(reference, candidate, queries, texts, k=5, batch_size=32):
+    """Compares a candidate encoder's cosine ranking of ``texts`` per query against the reference.
+
+    Reports the largest absolute score difference, the share of each query's
+    reference top-k found in the candidate's top-k, whether the top-1 agrees,
+    and the throughput of both encoders on ``texts``.
+    """
+    from main import top_k_indices
+
+    results = []
+    for encoder in (reference, candidate):
+        start = time.perf_counter()
+        embeddings = encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+        seconds = time.perf_counter() - start
+        scores = cos_sim(encoder.encode(queries, convert_to_numpy=True, show_progress_bar=False), embeddings)
+        results.append((scores, seconds))
+    (ref_scores, ref_seconds), (scores, seconds) = results
+
+    k = min(k, len(texts))
+    overlaps, top1 = [], []
+    for ref_row, row in zip(ref_scores, scores):
+        expected, found = top_k_indices(ref_row, k), top_k_indices(row, k)
+        overlaps.append(len(set(expected) & set(found)) / k if k else 1.0)
+        top1.append(bool(expected[:1] == found[:1]))
+    return {
+        "texts": len(texts),
+        "queries": len(queries),
+        "k": k,
+        "max_score_delta": float(np.abs(ref_scores - scores).max()) if scores.size else 0.0,
+        "top_k_overlap": round(float(np.mean(overlaps)), 4) if overlaps else 1.0,
+        "top_1_agreement": round(float(np.mean(top1)), 4) if top1 else 1.0,
+        "reference_texts_per_second": round(len(texts) / ref_seconds, 1) if ref_seconds else None,
+        "texts_per_second": round(len(texts) / seconds, 1) if seconds else None,
+    }
+
+
+def imports_torch(directory, backend):
+    """Whether loading and running the ``backend`` ONNX encoder pulls torch into a fresh interpreter."""
+    # A bare interpreter rather than a spawned worker, which would re-import the caller's main module.
+    code = (f"import sys; from encoders import OnnxEncoder; "
+            f"OnnxEncoder({os.path.abspath(directory)!r}, {backend!r}).encode(['A sample sentence to encode.']); "
+            f"print('torch' in sys.modules)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True)
+    return result.stdout.split()[-1] == "True"
+
+
+def collection_corpus(collections):
+    """Sub-queries and ranking texts of the given collections, as the ranker would encode them."""
+    from main import (
+        build_sub_queries, extract_collection_sections, load_collection, section_text, select_ranking_sections,
+    )
+
+    queries, texts = [], []
+    for name in collections:
+        input_data, pdf_paths, _ = load_collection(name)
+        store = extract_collection_sections(name, input_data, pdf_paths)
+        queries += build_sub_queries(input_data['persona']['role'], input_data['job_to_be_done']['task'])
+        texts += [section_text(store, i) for i in select_ranking_sections(store)]
+    return queries, texts
+
+
+def check(args):
+    collections = args.collections or sorted(d for d in os.listdir('.') if os.path.isdir(d) and d.startswith("Collection"))
+    queries, texts = collection_corpus(collections)
+    print(f"Parity corpus: {len(queries)} sub-queries, {len(texts)} sections from {len(collections)} collections.")
+    reference = load_encoder("torch", args.model)
+    report = {}
+    for backend in args.backends:
+        candidate = reference if backend == "torch" else load_encoder(backend, args.model, args.onnx_dir, args.threads)
+        result = check_parity(reference, candidate, queries, texts, args.k, args.batch_size)
+        result["passed"] = result["top_k_overlap"] >= args.min_overlap
+        if backend != "torch":
+            # The point of the ONNX backends is a smaller runtime; torch creeping back in defeats it.
+            result["imports_torch"] = imports_torch(args.onnx_dir, backend)
+            result["passed"] = result["passed"] and not result["imports_torch"]
+        report[backend] = result
+        print(f"{backend:>10}: {result['texts_per_second']} texts/s "
+              f"(reference {result['reference_texts_per_second']}), top-{result['k']} overlap "
+              f"{result['top_k_overlap']:.3f}, top-1 agreement {result['top_1_agreement']:.3f}, "
+              f"max score delta {result['max_score_delta']:.4f}"
+              f"{', imports torch' if result.get('imports_torch') else ''} -> {'ok' if result['passed'] else 'FAILED'}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    return all(result["passed"] for result in report.values())
+
+
+if __name__ == "__main__":
+    from main import MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export, validate and benchmark the encoder backends.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the model to ONNX and a dynamically quantized int8 copy.")
+    export_parser.add_argument("--model", default=MODEL_NAME, help="Model name or local path.")
+    export_parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    export_parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 model.")
+
+    check_parser = subparsers.add_parser("check", help="Ranking parity and throughput of each backend against torch.")
+    check_parser.add_argument("collections", nargs="*", help="Collection directories (default: every Collection* in cwd).")
+    check_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    check_parser.add_argument("--model", default=MODEL_NAME, help="Model name or local path.")
+    check_parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    check_parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads.")
+    check_parser.add_argument("--k", type=int, default=5, help="Ranking depth compared per sub-query.")
+    check_parser.add_argument("--batch-size", type=int, default=32)
+    check_parser.add_argument("--min-overlap", type=float, default=0.8,
+                              help="Fail when the mean top-k overlap with the reference drops below this.")
+    check_parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.onnx_dir, quantize=not args.no_quantize)
+        print(f"Exported '{args.model}' to '{args.onnx_dir}'.")
+    elif not check(args):
+        raise SystemExit(1)
@@ -1,70 +1,113 @@
 import os
 import sys
 import json
+import math
 import re
+import argparse
 import datetime
-import fitz
-from sentence_transformers import SentenceTransformer, util
+import time
+import weakref
+from bisect import bisect_left
+from functools import partial
+import numpy as np
+from bm25_index import BM25Index, TermCounts
+from chunking import SectionChunker
+from embedding_cache import EmbeddingCache
+from encoders import BACKENDS, DEFAULT_ONNX_DIR, backend_id, cos_sim, encoder_id, load_encoder
+from section_store import SectionStore
+
+# The layout, manifest and instrumentation modules are shared with Challenge
+# 1a; the Docker image copies them next to this file, and in a checkout they
+# are imported from Challenge_1a.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Challenge_1a"))
+import instrumentation
+import pdf_layout
+from instrumentation import span
+from manifest import MANIFEST_FILE, Manifest, source_digest
+from pdf_layout import load_or_extract
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+BM25_INDEX_FILE = "bm25_index.npz"
+OUTPUT_FILE = "challenge1b_output.json"
+# Modules whose code decides the rankings; a change to any of them reruns every collection.
+RANKING_SOURCES = ("main.py", "section_store.py", "chunking.py", "bm25_index.py", "encoders.py")
+# Sections encoded and scored per step, bounding the transient text and
+# float32 copies on very large collections.
+ENCODE_BLOCK = 4096
+IGNORED_SECTION_TITLES = ["introduction", "conclusion", "table of contents", "full document text", "note:", "notes:"]
+
+_query_embeddings = weakref.WeakKeyDictionary()
+
+def _full_text_section(lines):
+    return [{"title": "Full Document Text", "content": "".join(text for _, _, text in lines), "page": 1}]
+
+def _cut_sections(headings, lines):
+    """Cuts each heading's section from its (page, y) position to the next heading's.
+
+    ``headings`` are (page, y, title) in reading order; ``lines`` are the
+    (page, top y, text) of every line of the page text, in page order. A
+    line belongs to the section whose span holds its top, and keeps its
+    page order within the section.
+    """
+    order = sorted(range(len(lines)), key=lambda i: lines[i][:2])
+    tops = [lines[i][:2] for i in order]
+    ends = [(page, y) for page, y, _ in headings[1:]] + [(math.inf, 0)]
 
-def extract_structured_sections(doc):
+    sections = []
+    for (start_page, start_y, title), end in zip(headings, ends):
+        first, last = bisect_left(tops, (start_page, start_y)), bisect_left(tops, end)
+        content = "".join(lines[i][2] for i in sorted(order[first:last]))
+
+        content = content.replace(title, "", 1).strip()
+        if content:
+            sections.append({"title": title, "content": content, "page": start_page + 1})
+
+    return sections
+
+def _layout_lines(layout):
+    return [(n, y, text) for n in range(layout.page_count) for y, text in layout.page_lines(n)]
+
+def extract_structured_sections(layout):
+    """Sections under every heading-styled, single-line block of the document layout."""
     font_counts = {}
-    for page in doc:
-        for block in page.get_text("dict").get("blocks", []):
-            if "lines" in block:
-                for line in block["lines"]:
-                    if "spans" in line and line["spans"]:
-                        span = line["spans"][0]
-                        size = round(span["size"])
-                        is_bold = "bold" in span["font"].lower()
-                        font_counts[(size, is_bold)] = font_counts.get((size, is_bold), 0) + 1
+    for page_num in range(layout.page_count):
+        for style in layout.page_styles(page_num):
+            font_counts[style] = font_counts.get(style, 0) + 1
+    lines = _layout_lines(layout)
 
     if not font_counts:
-        return [{"title": "Full Document Text", "content": "".join(p.get_text() for p in doc), "page": 1}]
+        return _full_text_section(lines)
 
     body_size, body_bold = sorted(font_counts.items(), key=lambda x: x[1], reverse=True)[0][0]
 
     headings = []
-    for page_num, page in enumerate(doc):
-        blocks = page.get_text("dict", sort=True)["blocks"]
-        for block in blocks:
-            if "lines" in block and block["lines"][0]["spans"]:
-                span = block["lines"][0]["spans"][0]
-                text = " ".join(s["text"] for s in block["lines"][0]["spans"]).strip()
-                if not text: continue
+    for page_num in range(layout.page_count):
+        for size, is_bold, y, text, line_count in layout.block_heads(page_num):
+            if not text: continue
 
-                size = round(span["size"])
-                is_bold = "bold" in span["font"].lower()
-                is_heading = (size > body_size or (is_bold and not body_bold))
+            is_heading = (size > body_size or (is_bold and not body_bold))
 
-                if is_heading and len(block["lines"]) == 1 and len(text) < 120:
-                    headings.append({"page": page_num, "y": block["bbox"][1], "title": text})
+            if is_heading and line_count == 1 and len(text) < 120:
+                headings.append((page_num, y, text))
 
     if not headings:
-        return [{"title": "Full Document Text", "content": "".join(p.get_text() for p in doc), "page": 1}]
-
-    sections = []
-    for i, h in enumerate(headings):
-        start_page, start_y, title = h["page"], h["y"], h["title"]
-        end_page = headings[i+1]["page"] if i + 1 < len(headings) else len(doc) - 1
-        end_y = headings[i+1]["y"] if i + 1 < len(headings) else doc[end_page].rect.height
-
-        content = ""
-        for page_num in range(start_page, end_page + 1):
-            page = doc[page_num]
-            clip_y_start = start_y if page_num == start_page else 0
-            clip_y_end = end_y if page_num == end_page else page.rect.height
-            if clip_y_start >= clip_y_end: continue
-
-            content += page.get_text(clip=fitz.Rect(0, clip_y_start, page.rect.width, clip_y_end))
-
-        content = content.replace(title, "", 1).strip()
-        if content:
-            sections.append({"title": title, "content": content, "page": start_page + 1})
-
-    return sections
-
-def extract_recipe_sections(doc):
-    full_text = "\n".join(page.get_text() for page in doc)
+        return _full_text_section(lines)
+    return _cut_sections(headings, lines)
+
+def extract_outline_sections(layout):
+    """Sections under the headings of Challenge 1a's outline, as stored in the layout artifact.
+
+    Bookmark headings carry no position and start at the top of their page.
+    Falls back to extract_structured_sections when the layout holds no outline.
+    """
+    outline = layout.meta.get("outline")
+    if not outline:
+        return extract_structured_sections(layout)
+    headings = [(item["page"], item.get("y") or 0, item["text"].strip()) for item in outline]
+    return _cut_sections(headings, _layout_lines(layout))
+
+def extract_recipe_sections(layout):
+    full_text = "\n".join(layout.page_text(n) for n in range(layout.page_count))
     recipe_chunks = re.split(r'\n\s*\n([A-Z][\w\s-]{5,60})\n', full_text)
 
     sections = []
@@ -79,22 +122,149 @@ def extract_recipe_sections(doc):
 
     return sections
 
-def process_collection(collection_name, model):
+def encode_sections(model, section_texts, cache=None):
+    if cache is None:
+        return model.encode(section_texts, convert_to_numpy=True, show_progress_bar=False)
+
+    vectors, missing = cache.get_many(section_texts)
+    if missing:
+        missing_texts = [section_texts[i] for i in missing]
+        encoded = model.encode(missing_texts, convert_to_numpy=True, show_progress_bar=False)
+        vectors[missing] = encoded
+        cache.put_many(missing_texts, encoded)
+    return vectors
+
+def encode_bucketed(model, texts, lengths, cache=None, bucket_size=32):
+    """Encodes texts in buckets of similar token length to keep padding low."""
+    if cache is not None:
+        vectors, missing = cache.get_many(texts)
+    else:
+        vectors, missing = None, range(len(texts))
+    missing = np.asarray(missing, dtype=int)
+    order = missing[np.argsort(np.asarray(lengths)[missing], kind='stable')]
+    for start in range(0, len(order), bucket_size):
+        bucket = order[start:start + bucket_size]
+        encoded = model.encode([texts[i] for i in bucket], convert_to_numpy=True,
+                               batch_size=len(bucket), show_progress_bar=False)
+        if vectors is None:
+            vectors = np.zeros((len(texts), encoded.shape[1]), dtype=np.float32)
+        vectors[bucket] = encoded
+    if cache is not None and len(missing):
+        cache.put_many([texts[i] for i in missing], vectors[missing])
+    return vectors
+
+def encode_queries(model, queries):
+    """Encodes all sub-queries in one batch, memoized per model across collections."""
+    memo = _query_embeddings.setdefault(model, {})
+    missing = [q for q in dict.fromkeys(queries) if q not in memo]
+    if missing:
+        for query, vector in zip(missing, model.encode(missing, convert_to_numpy=True, show_progress_bar=False)):
+            memo[query] = vector
+    return np.stack([memo[q] for q in queries])
+
+def score_sections(query_embeddings, section_embeddings):
+    """Cosine similarities (queries x sections), upcasting one block of rows at a time."""
+    return np.concatenate([
+        cos_sim(query_embeddings, section_embeddings[start:start + ENCODE_BLOCK])
+        for start in range(0, len(section_embeddings), ENCODE_BLOCK)
+    ], axis=1)
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, ties kept in index order like a stable sort."""
+    k = min(k, len(scores))
+    if k == 0:
+        return []
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= threshold)
+    return candidates[np.argsort(-scores[candidates], kind='stable')][:k].tolist()
+
+def load_collection(collection_name):
+    """Reads a collection's input JSON; returns it with the PDF and output paths."""
     collection_folder = os.path.join(os.getcwd(), collection_name)
     input_filepath = os.path.join(collection_folder, "challenge1b_input.json")
     pdf_folder = os.path.join(collection_folder, "PDFs")
-    output_filepath = os.path.join(collection_folder, "challenge1b_output.json")
-
-    print(f"--- Starting processing for: {collection_name} ---")
+    output_filepath = os.path.join(collection_folder, OUTPUT_FILE)
 
     with open(input_filepath, 'r', encoding='utf-8') as f:
         input_data = json.load(f)
 
-    persona = input_data['persona']['role']
-    job_task = input_data['job_to_be_done']['task']
+    pdf_paths = {doc['filename']: os.path.join(pdf_folder, doc['filename']) for doc in input_data['documents']}
+    return input_data, pdf_paths, output_filepath
 
-    print("Step 1: Extracting sections using adaptive parser...")
-    all_sections = []
+def process_collection(collection_name, model, cache=None, chunker=None, prefilter_top_n=None,
+                       embedding_dtype=np.float16, lazy_sections=False, layout_dir=None, section_source="layout"):
+    print(f"--- Starting processing for: {collection_name} ---")
+    input_data, pdf_paths, output_filepath = load_collection(collection_name)
+
+    with instrumentation.run("collection", collection_name) as record:
+        all_sections = extract_collection_sections(collection_name, input_data, pdf_paths, lazy_sections,
+                                                   layout_dir, section_source, bool(prefilter_top_n))
+        record.count(len(all_sections))
+        final_output = rank_sections(
+            collection_name, input_data, all_sections, model, cache, chunker=chunker,
+            prefilter_top_n=prefilter_top_n,
+            index_path=os.path.join(os.path.dirname(output_filepath), BM25_INDEX_FILE),
+            embedding_dtype=embedding_dtype
+        )
+
+        with span("write_json"), open(output_filepath, 'w', encoding='utf-8') as f:
+            json.dump(final_output, f, indent=4)
+
+    print(f"--- Success! Output for {collection_name} saved to '{output_filepath}'. ---\n")
+    return len(all_sections)
+
+def collection_inputs(collection_name):
+    """Paths of the files a collection's ranking depends on, keyed relative to the collection."""
+    input_data, pdf_paths, output_filepath = load_collection(collection_name)
+    inputs = {"challenge1b_input.json": os.path.join(collection_name, "challenge1b_input.json")}
+    inputs.update({f"PDFs/{name}": path for name, path in pdf_paths.items()})
+    return inputs, output_filepath
+
+def ranking_tool_version(backend, onnx_dir):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = [os.path.join(here, name) for name in RANKING_SOURCES] + [pdf_layout.__file__]
+    return f"{source_digest(sources)}+{backend_id(backend, MODEL_NAME, onnx_dir)}"
+
+def stale_collections(collection_names, tool, params, force=False):
+    """Splits off the collections whose output is current; returns the rest and their manifests.
+
+    A collection is rerun when its input JSON, any of its PDFs, the ranking
+    code, the model backend or the ranking parameters changed since its
+    output was written, or always with ``force``.
+    """
+    stale, states = [], {}
+    for name in collection_names:
+        try:
+            paths, output_filepath = collection_inputs(name)
+        except Exception:
+            stale.append(name)  # fails again, and is reported, when processed
+            continue
+        manifest = Manifest(os.path.join(name, MANIFEST_FILE))
+        inputs = manifest.fingerprint(OUTPUT_FILE, paths)
+        if not force and manifest.is_current(OUTPUT_FILE, inputs, tool, params, output_filepath):
+            print(f"--- Skipping {name}: documents and input unchanged since the last run ---")
+            if inputs != manifest.entries[OUTPUT_FILE]["inputs"]:
+                manifest.record(OUTPUT_FILE, inputs, tool, params)  # touched but not edited
+                manifest.save()
+            continue
+        stale.append(name)
+        states[name] = (manifest, inputs)
+    return stale, states
+
+def record_collections(collection_names, states, tool, params):
+    for name in collection_names:
+        if name in states:
+            manifest, inputs = states[name]
+            manifest.record(OUTPUT_FILE, inputs, tool, params)
+            manifest.save()
+
+def plan_collection(collection_name, input_data, section_source="layout"):
+    """Picks the parser for a collection and the documents it should read.
+
+    ``section_source="outline"`` cuts technical documents at the headings of
+    Challenge 1a's outline instead of this module's own heading heuristic.
+    """
+    job_task = input_data['job_to_be_done']['task']
     documents_to_process = input_data['documents']
 
     if "collection 3" in collection_name.lower():
@@ -108,76 +278,190 @@ def process_collection(collection_name, model):
             ]
     else:
         parser_choice = "Technical Document Parser"
-        parser_func = extract_structured_sections
+        parser_func = extract_outline_sections if section_source == "outline" else extract_structured_sections
     print(f"-> Using {parser_choice} for this collection.")
+    return parser_func, documents_to_process
+
+def extract_document(parser_func, pdf_path, filename, lazy=False, layout_dir=None, index_terms=False):
+    """Sections of one PDF, from its cached layout in ``layout_dir`` when there is one.
+
+    With ``index_terms`` the store also keeps the term counts the BM25
+    prefilter is built from.
+    """
+    with span("extract_document") as stage:
+        layout = load_or_extract(pdf_path, layout_dir)
+        with span("cut_sections"):
+            sections = parser_func(layout)
+        stage.count(len(sections))
+        source = partial(document_contents, parser_func, pdf_path, layout_dir) if lazy else None
+        terms = None
+        if index_terms:
+            with span("count_terms"):
+                terms = TermCounts(prefixed_text(sec['title'], sec['content']) for sec in sections)
+        return SectionStore.from_sections(filename, sections, source, terms)
+
+def document_contents(parser_func, pdf_path, layout_dir=None):
+    """Re-extracts a document's section contents, in order, for lazy stores."""
+    return [sec['content'] for sec in parser_func(load_or_extract(pdf_path, layout_dir))]
+
+def extract_collection_sections(collection_name, input_data, pdf_paths, lazy=False, layout_dir=None,
+                                section_source="layout", index_terms=False):
+    """Step 1: extracts the sections of every input document.
+
+    ``pdf_paths`` maps each document's filename to its PDF on disk; the
+    collection name selects the parser. A lazy store keeps only titles and
+    positions and re-reads content from the PDFs when it is needed. With a
+    ``layout_dir``, document layouts cached there (by Challenge 1a or an
+    earlier run) are used instead of parsing the PDFs. ``index_terms`` keeps
+    the term counts the BM25 prefilter needs, as in extract_document.
+    """
+    print("Step 1: Extracting sections using adaptive parser...")
+    parser_func, documents_to_process = plan_collection(collection_name, input_data, section_source)
 
+    all_sections = SectionStore(lazy, index_terms)
     for doc_meta in documents_to_process:
-        pdf_path = os.path.join(pdf_folder, doc_meta['filename'])
-        if not os.path.exists(pdf_path): continue
-
-        doc = fitz.open(pdf_path)
-        sections = parser_func(doc)
-        for sec in sections:
-            all_sections.append({
-                "document": doc_meta['filename'],
-                "section_title": sec['title'],
-                "content": sec['content'],
-                "page_number": sec['page']
-            })
-        doc.close()
+        pdf_path = pdf_paths.get(doc_meta['filename'])
+        if not pdf_path or not os.path.exists(pdf_path): continue
+        all_sections.extend(extract_document(parser_func, pdf_path, doc_meta['filename'], lazy, layout_dir,
+                                             index_terms))
     print(f"-> Extracted {len(all_sections)} total sections.\n")
+    return all_sections
+
+def is_ignored_title(title):
+    return title.lower() in IGNORED_SECTION_TITLES
+
+def prefixed_text(title, content):
+    return title + ". " + title + ". " + content
+
+def section_text(store, i):
+    return prefixed_text(store.titles[i], store.content(i))
+
+def section_chunks(chunker, store, i, cache=None, measure=True):
+    """Splits section_text(store, i) into encoder texts; see SectionChunker.
+
+    Whole sections already in ``cache`` are not tokenized for the coverage
+    statistics, as they were counted when first encoded; ``measure=False``
+    skips them for every section.
+    """
+    title = store.titles[i]
+    prefix, content = title + ". " + title + ". ", store.content(i)
+    return chunker.split(prefix, content, measure and (cache is None or not cache.contains(prefix + content)))
+
+def build_sub_queries(persona, job_task):
+    """Prioritized sub-queries for a persona and job, most important first."""
+    if 'college friends' in job_task.lower():
+        return [ "Comprehensive Guide to Major Cities...", "Exciting outdoor activities...", "Fun nightlife...", "Affordable and budget-friendly hotels...", "General travel tips" ]
+    elif 'hr professional' in persona.lower():
+        return [ "Change or convert a flat form to a fillable PDF form...", "Create multiple PDF files...", "Convert content from the clipboard to a PDF...", "How to fill and sign PDF forms", "Send a document to get electronic signatures..." ]
+    elif 'food contractor' in persona.lower():
+        return ["Vegetarian and gluten-free main dishes for a buffet", "Vegetarian and gluten-free side dishes for a buffet", "Hearty vegetable lasagna recipe", "Mediterranean vegetarian dishes like falafel or baba ganoush", "Elegant vegetable dishes like ratatouille"]
+    return [f"As a {persona}, I need to {job_task}."]
+
+def select_ranking_sections(store):
+    """Rows worth ranking: boilerplate sections are dropped unless nothing else would be left."""
+    return [i for i, title in enumerate(store.titles) if not is_ignored_title(title)] or list(range(len(store)))
+
+def prefilter_sections(store, rows, sub_queries, top_n, index_path=None):
+    """Keeps the union of every sub-query's top_n BM25 matches among ``rows``, in order.
+
+    The index is assembled from the term counts the store took at extraction
+    (counted here only for a store without them), saved to ``index_path`` and
+    reused while the digests of the sections stay the same.
+    """
+    if not top_n or len(rows) <= top_n:
+        return rows
+    terms = store.terms
+    if terms is None:
+        terms = TermCounts(section_text(store, i) for i in range(len(store)))
+    index, loaded = BM25Index.load_or_build(index_path, terms, rows)
+    keep = set()
+    for query in sub_queries:
+        keep.update(top_k_indices(index.scores(query), top_n))
+    print(f"-> BM25 prefilter ({'loaded' if loaded else 'built'} index) kept {len(keep)} of {len(rows)} sections.")
+    return [rows[i] for i in sorted(keep)]
+
+def rank_sections(collection_name, input_data, all_sections, model, cache=None, embeddings=None, chunker=None,
+                  prefilter_top_n=None, index_path=None, embedding_dtype=np.float16):
+    """Steps 2-4: ranks a SectionStore and returns the output JSON as a dict.
+
+    ``embeddings`` optionally maps encoder texts to vectors computed ahead of
+    time; otherwise sections are encoded here. ``chunker`` splits long
+    sections into windows whose scores are folded back per section; by
+    default each section is encoded whole. With ``prefilter_top_n`` only
+    the BM25 candidates of the sub-queries are embedded and ranked.
+    Section embeddings are held as ``embedding_dtype``, and section content
+    is only materialized for the sections written out.
+    """
+    persona = input_data['persona']['role']
+    job_task = input_data['job_to_be_done']['task']
 
     print("Step 2: Pre-filtering for high-quality sections...")
-    ignore_list = ["introduction", "conclusion", "table of contents", "full document text", "note:", "notes:"]
-    sections_for_ranking = [
-        sec for sec in all_sections
-        if sec['section_title'].lower() not in ignore_list
-    ]
-    if not sections_for_ranking:
-        sections_for_ranking = all_sections
+    sections_for_ranking = select_ranking_sections(all_sections)
     print(f"-> {len(sections_for_ranking)} sections remain for semantic search.\n")
     
     if not sections_for_ranking:
-        final_output = { "metadata": {"input_documents": [d['filename'] for d in input_data['documents']], "persona": persona, "job_to_be_done": job_task,"processing_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()}, "extracted_sections": [], "subsection_analysis": [] }
-        with open(output_filepath, 'w', encoding='utf-8') as f: json.dump(final_output, f, indent=4)
-        print(f"--- No sections to rank for {collection_name}. Output generated. ---\n")
-        return
+        print("-> No sections to rank.")
+        return { "metadata": {"input_documents": [d['filename'] for d in input_data['documents']], "persona": persona, "job_to_be_done": job_task,"processing_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()}, "extracted_sections": [], "subsection_analysis": [] }
 
     print("Step 3: Performing Prioritized Multi-Query Search...")
-    sub_queries = []
-    if 'college friends' in job_task.lower():
-        sub_queries = [ "Comprehensive Guide to Major Cities...", "Exciting outdoor activities...", "Fun nightlife...", "Affordable and budget-friendly hotels...", "General travel tips" ]
-    elif 'hr professional' in persona.lower():
-        sub_queries = [ "Change or convert a flat form to a fillable PDF form...", "Create multiple PDF files...", "Convert content from the clipboard to a PDF...", "How to fill and sign PDF forms", "Send a document to get electronic signatures..." ]
-    elif 'food contractor' in persona.lower():
-        sub_queries = ["Vegetarian and gluten-free main dishes for a buffet", "Vegetarian and gluten-free side dishes for a buffet", "Hearty vegetable lasagna recipe", "Mediterranean vegetarian dishes like falafel or baba ganoush", "Elegant vegetable dishes like ratatouille"]
-    else:
-        sub_queries = [f"As a {persona}, I need to {job_task}."]
+    sub_queries = build_sub_queries(persona, job_task)
     print(f"-> Using {len(sub_queries)} prioritized sub-queries.")
-
-    section_texts = [s['section_title'] + ". " + s['section_title'] + ". " + s['content'] for s in sections_for_ranking]
-    section_embeddings = model.encode(section_texts, convert_to_tensor=True, show_progress_bar=False)
+    if prefilter_top_n:
+        with span("prefilter") as stage:
+            sections_for_ranking = prefilter_sections(all_sections, sections_for_ranking, sub_queries,
+                                                      prefilter_top_n, index_path)
+            stage.count(len(sections_for_ranking))
+
+    chunker = chunker or SectionChunker(model)
+    blocks, chunk_counts, total_tokens, seen_tokens = [], [], 0, 0
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    start = time.perf_counter()
+    for block_start in range(0, len(sections_for_ranking), ENCODE_BLOCK):
+        rows = sections_for_ranking[block_start:block_start + ENCODE_BLOCK]
+        # With precomputed embeddings the sections were counted when they were queued.
+        chunks = [section_chunks(chunker, all_sections, i, cache, measure=embeddings is None) for i in rows]
+        chunk_texts = [text for c in chunks for text in c.texts]
+        if embeddings is not None:
+            vectors = np.stack([embeddings[text] for text in chunk_texts])
+        else:
+            with span("encode", len(chunk_texts)):
+                if chunker.max_tokens is None:
+                    vectors = encode_sections(model, chunk_texts, cache)
+                else:
+                    vectors = encode_bucketed(model, chunk_texts, [n for c in chunks for n in c.lengths], cache)
+        blocks.append(np.asarray(vectors, dtype=embedding_dtype))
+        chunk_counts.extend(len(c.texts) for c in chunks)
+        total_tokens += sum(c.total for c in chunks)
+        seen_tokens += sum(c.seen for c in chunks)
+    chunk_embeddings = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+    if embeddings is None:
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"-> Encoded {len(sections_for_ranking)} sections as {len(chunk_embeddings)} texts in {elapsed:.2f}s ({len(sections_for_ranking) / elapsed:.1f} sections/s).")
+        if cache:
+            print(f"-> Embedding cache: {cache.hits - hits} hits, {cache.misses - misses} misses.")
+    if total_tokens:
+        print(f"-> The model sees {seen_tokens / total_tokens:.1%} of section content tokens.")
+
+    with span("encode_queries", len(sub_queries)):
+        query_embeddings = encode_queries(model, sub_queries)
+    with span("score", len(chunk_embeddings)):
+        all_scores = chunker.reduce(score_sections(query_embeddings, chunk_embeddings), chunk_counts)
 
     curated_results = []
     seen_sections = set()
-    for query in sub_queries:
+    for cosine_scores in all_scores:
         if len(curated_results) >= 5: break
-            
-        query_embedding = model.encode(query, convert_to_tensor=True)
-        cosine_scores = util.cos_sim(query_embedding, section_embeddings)[0]
-        
-        top_candidates_indices = sorted(range(len(cosine_scores)), key=lambda i: cosine_scores[i], reverse=True)[:2]
-
-        for idx in top_candidates_indices:
-            section = sections_for_ranking[idx]
-            section_key = (section['document'], section['section_title'])
+
+        for idx in top_k_indices(cosine_scores, 2):
+            row = sections_for_ranking[idx]
+            section_key = (all_sections.document(row), all_sections.titles[row])
             if section_key not in seen_sections:
-                curated_results.append(section)
+                curated_results.append(row)
                 seen_sections.add(section_key)
 
     print("\nStep 4: Generating final JSON output...")
     top_n = 5
-    top_sections = curated_results[:top_n]
+    top_sections = [all_sections.section(row) for row in curated_results[:top_n]]
     
     if "collection 3" in collection_name.lower() and 'vegetarian' in job_task.lower():
         meat_blocklist = ['pork', 'beef', 'chicken', 'turkey', 'sausage', 'bacon', 'lamb', 'veal', 'fish', 'seafood', 'salmon']
@@ -191,22 +475,70 @@ def process_collection(collection_name, model):
         extracted_sections_output.append({ "document": item['document'], "section_title": item['section_title'], "importance_rank": i + 1, "page_number": page_num })
         subsection_analysis_output.append({ "document": item['document'], "refined_text": item['content'], "page_number": page_num })
 
-    final_output = {
+    return {
         "metadata": { "input_documents": [doc['filename'] for doc in input_data['documents']], "persona": persona, "job_to_be_done": job_task, "processing_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat() },
         "extracted_sections": extracted_sections_output,
         "subsection_analysis": subsection_analysis_output
     }
 
-    with open(output_filepath, 'w', encoding='utf-8') as f:
-        json.dump(final_output, f, indent=4)
-
-    print(f"--- Success! Output for {collection_name} saved to '{output_filepath}'. ---\n")
+def add_cache_arguments(parser):
+    parser.add_argument("--cache-dir", default=".embedding_cache",
+                        help="Directory of the persistent section embedding cache.")
+    parser.add_argument("--cache-max-mb", type=int, default=512,
+                        help="Size cap of the embedding cache; least recently used entries are evicted.")
+    parser.add_argument("--cache-dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-encode every section.")
+
+def add_backend_arguments(parser):
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Encoder runtime: sentence-transformers on torch, or the exported ONNX / int8 ONNX graph.")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR,
+                        help="Exported ONNX model directory; exported from the local model files if missing.")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads.")
+
+def open_cache(args, model):
+    if args.no_cache:
+        return None
+    return EmbeddingCache(
+        args.cache_dir, encoder_id(model, MODEL_NAME),
+        model.get_sentence_embedding_dimension(), dtype=args.cache_dtype,
+        max_bytes=args.cache_max_mb * 1024 * 1024
+    )
 
 if __name__ == "__main__":
-    print("Initializing Sentence Transformer model...")
-    sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("Model loaded.")
-    
+    parser = argparse.ArgumentParser(description="Persona-driven section ranking over PDF collections.")
+    add_cache_arguments(parser)
+    add_backend_arguments(parser)
+    instrumentation.add_trace_arguments(parser)
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap PDF extraction, embedding and ranking across all collections.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Extraction processes in pipeline mode (default: CPU count).")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="Section texts per encode batch in pipeline mode.")
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="Most extracted documents buffered ahead of the embedding stage.")
+    parser.add_argument("--chunk-tokens", type=int, default=0,
+                        help="Split sections into windows of this many tokens instead of truncating them (0: off).")
+    parser.add_argument("--chunk-aggregate", choices=["max", "mean"], default="max",
+                        help="How chunk scores combine into a section score.")
+    parser.add_argument("--prefilter-top-n", type=int, default=0,
+                        help="Only embed the top N BM25 matches of each sub-query (0: embed every section).")
+    parser.add_argument("--embedding-dtype", choices=["float32", "float16"], default="float16",
+                        help="Precision section embeddings are held in while ranking.")
+    parser.add_argument("--lazy-sections", action="store_true",
+                        help="Keep no section text in memory; re-read it from the PDFs when needed (serial mode).")
+    parser.add_argument("--layout-dir", default=None,
+                        help="Directory of cached PDF layouts (e.g. Challenge 1a's --layout-dir); "
+                             "cached documents are not parsed again, and new ones are added.")
+    parser.add_argument("--section-source", choices=["layout", "outline"], default="layout",
+                        help="Cut technical documents at this module's heading heuristic, "
+                             "or at the outline Challenge 1a stored with the cached layout.")
+    parser.add_argument("--force", action="store_true",
+                        help="Rerun every collection, even those whose inputs are unchanged since the last run.")
+    args = parser.parse_args()
+    instrumentation.configure(args.trace, args.profile, args.profile_dir)
+
     all_collections = sorted([
         d for d in os.listdir('.') 
         if os.path.isdir(d) and d.startswith("Collection")
@@ -217,11 +549,51 @@ if __name__ == "__main__":
         sys.exit(1)
 
     print(f"\nFound collections to process: {all_collections}\n")
-    
-    for collection in all_collections:
-        try:
-            process_collection(collection, sbert_model)
-        except Exception as e:
-            print(f"!! An error occurred while processing {collection}: {e} !!")
 
-    print("All collections processed.")
\ No newline at end of file
+    tool = ranking_tool_version(args.backend, args.onnx_dir)
+    params = {"chunk_tokens": args.chunk_tokens, "chunk_aggregate": args.chunk_aggregate,
+              "prefilter_top_n": args.prefilter_top_n, "embedding_dtype": args.embedding_dtype,
+              "section_source": args.section_source}
+    stale, states = stale_collections(all_collections, tool, params, args.force)
+    skipped = len(all_collections) - len(stale)
+    if not stale:
+        print(f"All {skipped} collections are unchanged since the last run; nothing to do (use --force to rerun).")
+        sys.exit(0)
+
+    print(f"Initializing Sentence Transformer model ({args.backend} backend)...")
+    sbert_model = load_encoder(args.backend, MODEL_NAME, args.onnx_dir, args.threads)
+    print("Model loaded.")
+
+    embedding_cache = open_cache(args, sbert_model)
+    chunker = SectionChunker(sbert_model, args.chunk_tokens, args.chunk_aggregate)
+
+    if args.pipeline:
+        from pipeline import run_pipeline
+        with instrumentation.run("pipeline", ", ".join(stale)) as record:
+            processed = run_pipeline(stale, sbert_model, embedding_cache, workers=args.workers,
+                                     batch_size=args.batch_size, queue_size=args.queue_size, chunker=chunker,
+                                     prefilter_top_n=args.prefilter_top_n,
+                                     embedding_dtype=np.dtype(args.embedding_dtype),
+                                     layout_dir=args.layout_dir, section_source=args.section_source)
+            record.count(len(processed))
+    else:
+        processed = []
+        for collection in stale:
+            try:
+                process_collection(collection, sbert_model, embedding_cache, chunker, args.prefilter_top_n,
+                                   np.dtype(args.embedding_dtype), args.lazy_sections, args.layout_dir,
+                                   args.section_source)
+                processed.append(collection)
+            except Exception as e:
+                print(f"!! An error occurred while processing {collection}: {e} !!")
+            finally:
+                # Once per collection: the encode helpers only add entries in memory.
+                if embedding_cache:
+                    embedding_cache.save()
+    record_collections(processed, states, tool, params)
+
+    if embedding_cache:
+        stats = embedding_cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries stored.")
+    print(f"All collections processed: {len(processed)} ranked, {skipped} skipped as unchanged, "
+          f"{len(stale) - len(processed)} failed.")
\ No newline at end of file
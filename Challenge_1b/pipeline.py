@@ -0,0 +1,260 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+from chunking import SectionChunker
+from main import (
+    BM25_INDEX_FILE, build_sub_queries, encode_bucketed, extract_document, is_ignored_title, load_collection,
+    plan_collection, prefilter_sections, rank_sections, section_chunks, select_ranking_sections,
+)
+from section_store import SectionStore
+
+# Imported after main, which puts the shared Challenge 1a modules on sys.path.
+from instrumentation import span
+
+RESULT_POLL_SECONDS = 1.0
+# Pending texts are encoded once this many batches have gathered, sorted by
+# token length first so each batch pads little.
+BUCKET_BATCHES = 4
+
+
+class _Collection:
+    """Progress of one collection through the pipeline."""
+
+    def __init__(self, name, input_data, output_filepath, document_count):
+        self.name = name
+        self.input_data = input_data
+        self.output_filepath = output_filepath
+        self.index_path = os.path.join(os.path.dirname(output_filepath), BM25_INDEX_FILE)
+        self.documents = [None] * document_count
+        self.remaining = document_count
+        self.error = None
+        self.needed = set()
+        self.sections = None
+
+    def join_documents(self, terms=False):
+        """Merges the per-document stores, in input order, once all have arrived."""
+        self.sections = SectionStore.concat((store for store in self.documents if store is not None), terms=terms)
+        self.documents = None
+
+
+def _produce(executor, tasks, results, slots, layout_dir=None, index_terms=False):
+    """Submits extraction tasks, never holding more than the queue can take.
+
+    Once the pool refuses work (a worker died, so it is broken), the tasks
+    left are failed with that error. The consumer still gets one result per
+    task, instead of waiting forever for tasks that were never submitted.
+    """
+    error = None
+    for collection, position, parser_func, pdf_path, filename in tasks:
+        slots.acquire()
+        if error is None:
+            try:
+                future = executor.submit(extract_document, parser_func, pdf_path, filename,
+                                         layout_dir=layout_dir, index_terms=index_terms)
+            except Exception as e:
+                error = e
+        if error is not None:
+            future = Future()
+            future.set_exception(error)
+        future.add_done_callback(lambda f, c=collection, p=position: results.put((c, p, f)))
+
+
+def _next_result(results, producer_errors):
+    """Waits for the next extraction result, failing if the producer thread has died."""
+    while True:
+        try:
+            return results.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            if producer_errors:
+                raise RuntimeError(f"extraction stopped: {producer_errors[0]}") from producer_errors[0]
+
+
+def run_pipeline(collection_names, model, cache=None, workers=None, batch_size=64, queue_size=32, chunker=None,
+                 prefilter_top_n=None, embedding_dtype=np.float16, layout_dir=None, section_source="layout"):
+    """Processes collections with extraction, embedding and ranking overlapped.
+
+    A process pool extracts every document of every collection and streams the
+    sections back through a bounded queue. The main thread encodes section
+    texts in fixed-size batches as they arrive, shared across collections, and
+    ranks each collection as soon as all of its sections are embedded. Texts
+    wait until ``BUCKET_BATCHES`` batches have gathered and are then batched
+    by token length. Each collection's output is the same as
+    process_collection would write.
+
+    With ``prefilter_top_n`` a collection's BM25 candidates are only known once
+    all its documents are extracted, so its sections are queued for encoding
+    at that point instead of as they arrive. The workers count each
+    section's terms, and the index is assembled from those counts.
+
+    Embeddings are kept as ``embedding_dtype`` and dropped once no collection
+    still waiting to be ranked needs them. A collection that fails drops its
+    texts still waiting to be encoded, too.
+
+    ``layout_dir`` and ``section_source`` are passed through to extraction as
+    in process_collection. Extraction runs in worker processes and is not
+    traced; encoding and ranking spans go to the caller's run, if any.
+
+    Returns the names of the collections whose output was written.
+    """
+    start = time.perf_counter()
+    chunker = chunker or SectionChunker(model)
+    collections, tasks = [], []
+    for name in collection_names:
+        try:
+            input_data, pdf_paths, output_filepath = load_collection(name)
+            print(f"--- Planning {name} ---")
+            parser_func, documents = plan_collection(name, input_data, section_source)
+        except Exception as e:
+            print(f"!! An error occurred while processing {name}: {e} !!")
+            continue
+        documents = [doc for doc in documents if os.path.exists(pdf_paths.get(doc['filename']) or "")]
+        collection = _Collection(name, input_data, output_filepath, len(documents))
+        collections.append(collection)
+        for position, doc in enumerate(documents):
+            tasks.append((collection, position, parser_func, pdf_paths[doc['filename']], doc['filename']))
+    print(f"\nPipeline: {len(tasks)} documents across {len(collections)} collections.\n")
+
+    embeddings = {}
+    processed = []
+    pending = {}
+    queued = set()
+    waiting = []
+    stats = {"sections": 0, "texts": 0, "total": 0, "seen": 0, "seconds": 0.0}
+
+    def enqueue(collection, store, rows):
+        for i in rows:
+            chunks = section_chunks(chunker, store, i, cache)
+            stats["sections"] += 1
+            stats["total"] += chunks.total
+            stats["seen"] += chunks.seen
+            collection.needed.update(chunks.texts)
+            for text, length in zip(chunks.texts, chunks.lengths):
+                if text not in queued:
+                    queued.add(text)
+                    # Cached texts are not measured; they are not encoded either.
+                    pending[text] = length or 0
+
+    def encode():
+        texts, lengths = list(pending), list(pending.values())
+        pending.clear()
+        encode_start = time.perf_counter()
+        with span("encode", len(texts)):
+            vectors = encode_bucketed(model, texts, lengths, cache, bucket_size=batch_size)
+        stats["seconds"] += time.perf_counter() - encode_start
+        stats["texts"] += len(texts)
+        embeddings.update(zip(texts, np.asarray(vectors, dtype=embedding_dtype)))
+
+    def release(collection):
+        collection.sections = None
+        active = [c for c in collections
+                  if c is not collection and c.error is None and (c.sections is not None or c.documents is not None)]
+        for text in collection.needed:
+            if not any(text in c.needed for c in active):
+                embeddings.pop(text, None)
+                pending.pop(text, None)
+                queued.discard(text)
+        collection.needed = set()
+
+    def finish(collection):
+        if collection.error is not None:
+            print(f"!! An error occurred while processing {collection.name}: {collection.error} !!")
+            collection.documents = None
+            release(collection)
+            return
+        collection.join_documents(bool(prefilter_top_n))
+        sections = collection.sections
+        if prefilter_top_n:
+            input_data = collection.input_data
+            sub_queries = build_sub_queries(input_data['persona']['role'], input_data['job_to_be_done']['task'])
+            enqueue(collection, sections, prefilter_sections(
+                sections, select_ranking_sections(sections), sub_queries, prefilter_top_n, collection.index_path
+            ))
+        elif all(is_ignored_title(title) for title in sections.titles):
+            # Ignored sections are only ranked when nothing else is left, so
+            # they are embedded only once that is known.
+            enqueue(collection, sections, range(len(sections)))
+        waiting.append(collection)
+
+    def rank_ready():
+        for collection in [c for c in waiting if c.needed.issubset(embeddings.keys())]:
+            waiting.remove(collection)
+            print(f"--- Ranking {collection.name} ---")
+            try:
+                with span("rank", len(collection.sections)):
+                    final_output = rank_sections(
+                        collection.name, collection.input_data, collection.sections, model,
+                        cache, embeddings, chunker, prefilter_top_n, collection.index_path, embedding_dtype
+                    )
+                with span("write_json"), open(collection.output_filepath, 'w', encoding='utf-8') as f:
+                    json.dump(final_output, f, indent=4)
+            except Exception as e:
+                print(f"!! An error occurred while processing {collection.name}: {e} !!")
+                continue
+            finally:
+                release(collection)
+            processed.append(collection.name)
+            print(f"--- Success! Output for {collection.name} saved to '{collection.output_filepath}'. ---\n")
+
+    for collection in collections:
+        if collection.remaining == 0:
+            finish(collection)
+    rank_ready()
+
+    results = queue.Queue(maxsize=queue_size)
+    slots = threading.BoundedSemaphore(queue_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        producer_errors = []
+
+        def produce():
+            try:
+                _produce(executor, tasks, results, slots, layout_dir, bool(prefilter_top_n))
+            except BaseException as e:
+                producer_errors.append(e)
+                raise
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        for _ in range(len(tasks)):
+            collection, position, future = _next_result(results, producer_errors)
+            slots.release()
+            try:
+                sections = future.result()
+            except Exception as e:
+                if collection.error is None:
+                    collection.error = e
+                    # Nothing of a failed collection is ranked, so its texts
+                    # are neither encoded nor kept.
+                    collection.documents = None
+                    release(collection)
+                sections = None
+            if collection.error is None:
+                collection.documents[position] = sections
+                if not prefilter_top_n:
+                    enqueue(collection, sections,
+                            [i for i, title in enumerate(sections.titles) if not is_ignored_title(title)])
+            collection.remaining -= 1
+            if collection.remaining == 0:
+                finish(collection)
+
+            if len(pending) >= batch_size * BUCKET_BATCHES:
+                encode()
+            rank_ready()
+        producer.join()
+
+    if pending:
+        encode()
+    rank_ready()
+    if cache is not None:
+        cache.save()
+    print(f"Pipeline: embedded {stats['sections']} sections as {stats['texts']} texts, "
+          f"{stats['sections'] / max(stats['seconds'], 1e-9):.1f} sections/s while encoding; "
+          f"done in {time.perf_counter() - start:.2f}s.")
+    if stats["total"]:
+        print(f"Pipeline: the model sees {stats['seen'] / stats['total']:.1%} of section content tokens.")
+    return processed
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from bm25_index import BM25Index
+from encoders import BACKENDS, DEFAULT_ONNX_DIR, load_encoder
+from main import (
+    MODEL_NAME, build_sub_queries, encode_queries, extract_collection_sections, load_collection,
+    score_sections, section_text, select_ranking_sections, top_k_indices,
+)
+
+
+def _dense_top_k(model, query_embeddings, texts, k, dtype=np.float32):
+    embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype(dtype)
+    scores = score_sections(query_embeddings, embeddings)
+    return [top_k_indices(row, k) for row in scores]
+
+
+def benchmark_collection(collection_name, model, top_ns, k=2):
+    """Compares BM25-prefiltered dense ranking against dense ranking of every section.
+
+    Recall is the share of each sub-query's full dense top-k that survives the
+    prefilter, averaged over sub-queries. Latency covers encoding, scoring and
+    (for the prefilter) the BM25 lookups; the index build is reported apart
+    since it is persisted and reused. The float16 match is the share of
+    sub-queries whose full dense top-k is unchanged when the embeddings are
+    held as float16, the default precision for ranking.
+    """
+    input_data, pdf_paths, _ = load_collection(collection_name)
+    store = extract_collection_sections(collection_name, input_data, pdf_paths)
+    sections = select_ranking_sections(store)
+    sub_queries = build_sub_queries(input_data['persona']['role'], input_data['job_to_be_done']['task'])
+    texts = [section_text(store, i) for i in sections]
+    query_embeddings = encode_queries(model, sub_queries)
+
+    start = time.perf_counter()
+    full_top = _dense_top_k(model, query_embeddings, texts, k)
+    full_seconds = time.perf_counter() - start
+    half_top = _dense_top_k(model, query_embeddings, texts, k, np.float16)
+    float16_match = sum(a == b for a, b in zip(half_top, full_top)) / len(full_top) if full_top else 1.0
+
+    start = time.perf_counter()
+    index = BM25Index.build(texts)
+    build_seconds = time.perf_counter() - start
+
+    rows = []
+    for top_n in top_ns:
+        start = time.perf_counter()
+        candidates = sorted(set(i for query in sub_queries for i in top_k_indices(index.scores(query), top_n)))
+        candidate_top = _dense_top_k(model, query_embeddings, [texts[i] for i in candidates], k)
+        seconds = time.perf_counter() - start
+
+        recalls = [
+            len(set(candidates[i] for i in found) & set(expected)) / len(expected)
+            for found, expected in zip(candidate_top, full_top) if expected
+        ]
+        rows.append({
+            "top_n": top_n,
+            "candidates": len(candidates),
+            "recall_at_k": round(sum(recalls) / len(recalls), 3) if recalls else 1.0,
+            "seconds": round(seconds, 3),
+            "speedup": round(full_seconds / seconds, 2) if seconds else None,
+        })
+
+    return {
+        "collection": collection_name,
+        "sections": len(sections),
+        "sub_queries": len(sub_queries),
+        "k": k,
+        "full_dense_seconds": round(full_seconds, 3),
+        "float16_top_k_match": round(float16_match, 3),
+        "index_build_seconds": round(build_seconds, 3),
+        "prefilter": rows,
+    }
+
+
+def print_report(result):
+    print(f"\n{result['collection']}: {result['sections']} sections, {result['sub_queries']} sub-queries, "
+          f"full dense {result['full_dense_seconds']:.3f}s, index build {result['index_build_seconds']:.3f}s, "
+          f"float16 top-{result['k']} match {result['float16_top_k_match']:.3f}")
+    print(f"{'top-N':>7} {'candidates':>11} {'recall@' + str(result['k']):>10} {'seconds':>9} {'speedup':>8}")
+    for row in result["prefilter"]:
+        print(f"{row['top_n']:>7} {row['candidates']:>11} {row['recall_at_k']:>10.3f} {row['seconds']:>9.3f} {row['speedup']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall and latency of the BM25 prefilter against full dense scoring.")
+    parser.add_argument("collections", nargs="*", help="Collection directories (default: every Collection* in cwd).")
+    parser.add_argument("--top-n", type=int, nargs="+", default=[10, 25, 50, 100],
+                        help="Prefilter sizes to compare.")
+    parser.add_argument("--k", type=int, default=2, help="Dense results per sub-query, as used for ranking.")
+    parser.add_argument("--model", default=MODEL_NAME, help="Model name or local path.")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    collections = args.collections or sorted(d for d in os.listdir('.') if os.path.isdir(d) and d.startswith("Collection"))
+    model = load_encoder(args.backend, args.model, args.onnx_dir)
+    results = []
+    for collection in collections:
+        results.append(benchmark_collection(collection, model, args.top_n, args.k))
+    for result in results:
+        print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from chunking import SectionChunker
+from encoders import load_encoder
+from main import (
+    MODEL_NAME, add_backend_arguments, add_cache_arguments, extract_collection_sections, open_cache, rank_sections,
+)
+
+LATENCY_WINDOW = 1000
+CACHE_SAVE_SECONDS = 60
+
+
+class BatchingEncoder:
+    """Model wrapper that coalesces concurrent encode calls into shared batches.
+
+    Each ``encode`` call queues its texts and blocks. A single worker thread
+    takes the first waiting call, gathers any others that arrive within
+    ``max_wait_ms`` (up to ``max_batch`` texts) and runs one model forward pass
+    for all of them. It exposes the subset of the SentenceTransformer API the
+    ranking code uses, so it can be passed wherever a model is expected,
+    including the ``tokenizer`` and ``max_seq_length`` SectionChunker reads.
+    """
+
+    def __init__(self, model, max_batch=256, max_wait_ms=10):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.calls = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="encoder", daemon=True)
+        self._worker.start()
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def tokenizer(self):
+        return getattr(self.model, "tokenizer", None)
+
+    @property
+    def max_seq_length(self):
+        return getattr(self.model, "max_seq_length", None)
+
+    def encode(self, sentences, convert_to_tensor=False, show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        future = Future()
+        self._queue.put((texts, future))
+        vectors = future.result()
+        if single:
+            vectors = vectors[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(vectors)
+        return vectors
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, size = [item], len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._encode_batch(batch, size)
+
+    def _encode_batch(self, batch, size):
+        texts = [text for texts, _ in batch for text in texts]
+        try:
+            vectors = np.asarray(self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.calls += len(batch)
+        self.texts += size
+        start = 0
+        for texts, future in batch:
+            future.set_result(vectors[start:start + len(texts)])
+            start += len(texts)
+
+
+class SynchronizedCache:
+    """Serializes access to an EmbeddingCache, which assumes a single writer."""
+
+    def __init__(self, cache, save_interval=CACHE_SAVE_SECONDS):
+        self._cache = cache
+        self._lock = threading.Lock()
+        self.save_interval = save_interval
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def get_many(self, texts):
+        with self._lock:
+            return self._cache.get_many(texts)
+
+    def put_many(self, texts, vectors):
+        with self._lock:
+            self._cache.put_many(texts, vectors)
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def save_if_due(self):
+        """Saves new entries at most once per ``save_interval`` rather than after every request."""
+        with self._lock:
+            if self._dirty and time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def _save(self):
+        self._cache.save()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+
+class RankingService:
+    """Runs ranking requests against a warm model and keeps request stats.
+
+    PyMuPDF is not thread-safe, so section extraction is serialized; ranking
+    and encoding of concurrent requests overlap.
+    """
+
+    def __init__(self, encoder, cache=None):
+        self.encoder = encoder
+        self.cache = SynchronizedCache(cache) if cache is not None else None
+        self.chunker = SectionChunker(encoder)
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._extract_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def rank(self, payload):
+        """Handles one request body and returns the challenge1b output dict.
+
+        The body holds the challenge1b input JSON under ``input`` and either a
+        ``pdf_dir`` holding the documents or a ``pdf_paths`` object mapping each
+        filename to its path. ``collection`` selects the parser like the
+        collection directory name does in batch mode; it defaults to the name
+        of the directory above ``pdf_dir``.
+        """
+        with self._stats_lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            input_data = payload["input"]
+            pdf_dir = payload.get("pdf_dir")
+            pdf_paths = payload.get("pdf_paths")
+            if pdf_paths is None:
+                if pdf_dir is None:
+                    raise ValueError("request needs 'pdf_dir' or 'pdf_paths'")
+                pdf_paths = {doc['filename']: os.path.join(pdf_dir, doc['filename']) for doc in input_data['documents']}
+            collection_name = payload.get("collection")
+            if collection_name is None:
+                collection_name = os.path.basename(os.path.dirname(os.path.abspath(pdf_dir))) if pdf_dir else ""
+
+            with self._extract_lock:
+                sections = extract_collection_sections(collection_name, input_data, pdf_paths)
+            result = rank_sections(collection_name, input_data, sections, self.encoder, self.cache, chunker=self.chunker)
+            if self.cache is not None:
+                self.cache.save_if_due()
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.requests += 1
+                self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = np.array(self._latencies)
+            stats = {
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+            }
+        if len(latencies):
+            stats["latency_ms"] = {
+                "window": len(latencies),
+                "mean": round(float(latencies.mean()) * 1000, 1),
+                "p50": round(float(np.percentile(latencies, 50)) * 1000, 1),
+                "p95": round(float(np.percentile(latencies, 95)) * 1000, 1),
+                "max": round(float(latencies.max()) * 1000, 1),
+            }
+        stats["encoder"] = {
+            "queue_depth": self.encoder.queue_depth(),
+            "batches": self.encoder.batches,
+            "calls": self.encoder.calls,
+            "texts": self.encoder.texts,
+            "calls_per_batch": round(self.encoder.calls / self.encoder.batches, 2) if self.encoder.batches else 0,
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+
+class RankingRequestHandler(BaseHTTPRequestHandler):
+    """``POST /rank`` runs a request; ``GET /stats`` and ``GET /health`` report status."""
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.service.stats())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/rank":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._send(400, {"error": f"invalid JSON body: {e}"})
+            return
+        try:
+            self._send(200, self.server.service.rank(payload))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {"error": f"bad request: {e!r}"})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def _send(self, status, body):
+        data = json.dumps(body, indent=4).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), RankingRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def request(url, payload=None, timeout=600):
+    """Minimal client: POSTs ``payload`` to ``url``, or GETs it if there is none."""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.load(response)
+
+
+def serve(args):
+    print(f"Initializing Sentence Transformer model from '{args.model}' ({args.backend} backend)...")
+    model = load_encoder(args.backend, args.model, args.onnx_dir, args.threads)
+    print("Model loaded.")
+
+    encoder = BatchingEncoder(model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    service = RankingService(encoder, open_cache(args, model))
+    server = make_server(service, args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_address[1]} (POST /rank, GET /stats, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        encoder.close()
+        if service.cache is not None:
+            service.cache.save()
+
+
+def send(args):
+    base = f"http://{args.host}:{args.port}"
+    if args.stats:
+        print(json.dumps(request(base + "/stats"), indent=4))
+        return
+
+    collection = os.path.abspath(args.collection)
+    with open(os.path.join(collection, "challenge1b_input.json"), 'r', encoding='utf-8') as f:
+        input_data = json.load(f)
+    result = request(base + "/rank", {
+        "input": input_data,
+        "pdf_dir": os.path.join(collection, "PDFs"),
+        "collection": os.path.basename(collection),
+    })
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4)
+        print(f"Output saved to '{args.output}'.")
+    else:
+        print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local ranking service that keeps the model loaded between requests.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Load the model once and serve ranking requests.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--model", default=MODEL_NAME,
+                              help="Model name or local path; with HF_HUB_OFFLINE=1 only the local copy is used.")
+    serve_parser.add_argument("--max-batch", type=int, default=256,
+                              help="Most texts coalesced into one encode batch.")
+    serve_parser.add_argument("--max-wait-ms", type=float, default=10,
+                              help="How long a batch waits for concurrent requests to join it.")
+    add_cache_arguments(serve_parser)
+    add_backend_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve)
+
+    send_parser = subparsers.add_parser("send", help="Send a collection directory to a running service.")
+    send_parser.add_argument("collection", nargs="?", help="Collection directory with challenge1b_input.json and PDFs/.")
+    send_parser.add_argument("--host", default="127.0.0.1")
+    send_parser.add_argument("--port", type=int, default=8765)
+    send_parser.add_argument("--output", help="Write the output JSON here instead of printing it.")
+    send_parser.add_argument("--stats", action="store_true", help="Print the service stats instead.")
+    send_parser.set_defaults(func=send)
+
+    args = parser.parse_args()
+    if args.command == "send" and not args.stats and not args.collection:
+        parser.error("send needs a collection directory or --stats")
+    args.func(args)
@@ -0,0 +1,134 @@
+from array import array
+
+from bm25_index import TermCounts
+
+
+class SectionStore:
+    """Columnar store of extracted sections.
+
+    A section is a row: its document (an index into ``documents``), title,
+    start page and its ordinal within the document. By default the content
+    lives in one UTF-8 text arena and is decoded only when asked for, so a
+    collection costs about one byte per ASCII character plus a few dozen bytes
+    per row instead of a dict and a str object per section.
+
+    A lazy store keeps no content at all. Each document has a source, a
+    callable returning its section contents in order, and content is
+    re-extracted one document at a time when needed. Rows are read in order
+    while encoding, so each document is parsed once more.
+
+    A store made for the BM25 prefilter also keeps ``terms``, the TermCounts
+    of every row's text, taken while the content is at hand; the prefilter
+    index is assembled from them without reading any content back.
+    """
+
+    def __init__(self, lazy=False, terms=False):
+        self.lazy = lazy
+        self.terms = TermCounts() if terms else None
+        self.documents = []
+        self.titles = []
+        self._sources = []
+        self._document_ids = array('i')
+        self._pages = array('i')
+        self._ordinals = array('i')
+        self._row_counts = []
+        self._offsets = array('q', [0])
+        self._arena = bytearray()
+        self._document_index = {}
+        self._loaded = (None, None)
+
+    @classmethod
+    def from_sections(cls, document, sections, source=None, terms=None):
+        """Builds a store from one document's parser output (title/content/page dicts).
+
+        With a ``source`` the store is lazy and drops the content. ``terms``
+        are the sections' TermCounts, if the store is to keep them.
+        """
+        store = cls(lazy=source is not None)
+        for sec in sections:
+            store.add(document, sec['title'], sec['content'], sec['page'])
+        store.terms = terms
+        if source is not None:
+            store._sources[store._document_id(document)] = source
+        return store
+
+    @classmethod
+    def concat(cls, stores, lazy=False, terms=False):
+        """Joins stores in order into a new one."""
+        store = cls(lazy, terms)
+        for other in stores:
+            store.extend(other)
+        return store
+
+    def extend(self, other):
+        """Appends every row of ``other``, which must be equally lazy and keep terms alike."""
+        if other.lazy != self.lazy:
+            raise ValueError("cannot mix lazy and in-memory section stores")
+        if (other.terms is None) != (self.terms is None):
+            raise ValueError("cannot mix section stores with and without term counts")
+        if self.terms is not None:
+            self.terms.extend(other.terms)
+        remap = []
+        for document, source, count in zip(other.documents, other._sources, other._row_counts):
+            document_id = self._document_id(document)
+            self._sources[document_id] = source
+            self._row_counts[document_id] += count
+            remap.append(document_id)
+        base = self._offsets[-1]
+        self.titles.extend(other.titles)
+        self._document_ids.extend(array('i', (remap[d] for d in other._document_ids)))
+        self._pages.extend(other._pages)
+        self._ordinals.extend(other._ordinals)
+        self._offsets.extend(array('q', (base + offset for offset in other._offsets[1:])))
+        self._arena += other._arena
+
+    def _document_id(self, document):
+        document_id = self._document_index.get(document)
+        if document_id is None:
+            document_id = self._document_index[document] = len(self.documents)
+            self.documents.append(document)
+            self._sources.append(None)
+            self._row_counts.append(0)
+        return document_id
+
+    def add(self, document, title, content, page):
+        document_id = self._document_id(document)
+        self._document_ids.append(document_id)
+        self.titles.append(title)
+        self._pages.append(page)
+        self._ordinals.append(self._row_counts[document_id])
+        self._row_counts[document_id] += 1
+        if not self.lazy:
+            self._arena += content.encode('utf-8')
+        self._offsets.append(len(self._arena))
+
+    def __len__(self):
+        return len(self.titles)
+
+    def document(self, i):
+        return self.documents[self._document_ids[i]]
+
+    def page(self, i):
+        return self._pages[i]
+
+    def content(self, i):
+        if not self.lazy:
+            return self._arena[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+        document_id = self._document_ids[i]
+        if self._loaded[0] != document_id:
+            self._loaded = (document_id, self._sources[document_id]())
+        return self._loaded[1][self._ordinals[i]]
+
+    def section(self, i):
+        """Materializes row ``i`` as the section dict used for output."""
+        return {
+            "document": self.document(i),
+            "section_title": self.titles[i],
+            "content": self.content(i),
+            "page_number": self.page(i),
+        }
+
+    def nbytes(self):
+        """Approximate size of the stored text and row data."""
+        columns = (self._document_ids, self._pages, self._ordinals, self._offsets)
+        return len(self._arena) + sum(len(t) for t in self.titles) + sum(c.itemsize * len(c) for c in columns)
@@ -0,0 +1,202 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from synthetic_pdfs import DocumentSpec, cached_document, make_collection
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Challenge_1a"))
+from instrumentation import peak_rss_mb
+
+TIERS = {
+    "small": {"pages": (10, 100, 1000), "documents": (10, 100)},
+    "full": {"pages": (10, 100, 1000, 10000), "documents": (10, 100, 1000, 5000)},
+}
+# Metrics where a larger value is worse; throughputs follow from wall time.
+GUARDED_METRICS = ("wall_seconds", "peak_rss_mb")
+
+
+def _import_challenges():
+    sys.path[:0] = [os.path.join(ROOT, "Challenge_1a"), os.path.join(ROOT, "Challenge_1b")]
+
+
+def _run_outline(pdf_path):
+    """Challenge 1a on one PDF; runs in a fresh process."""
+    _import_challenges()
+    from process_pdfs import PdfProcessor
+
+    setup_rss = peak_rss_mb()
+    start = time.perf_counter()
+    processor = PdfProcessor(pdf_path)
+    processor.process()
+    sections = len(processor.to_json()["outline"])
+    return time.perf_counter() - start, sections, setup_rss, peak_rss_mb()
+
+
+def _run_collection(root, name, backend, model_name, onnx_dir):
+    """Challenge 1b on one collection, model loading excluded; runs in a fresh process."""
+    _import_challenges()
+    from encoders import load_encoder
+    from main import process_collection
+
+    model = load_encoder(backend, model_name, onnx_dir)
+    os.chdir(root)
+    setup_rss = peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sections = process_collection(name, model)
+    return time.perf_counter() - start, sections, setup_rss, peak_rss_mb()
+
+
+def measure(func, *args, repeat=1):
+    """Runs ``func`` in ``repeat`` fresh processes; keeps the fastest time and the highest peak RSS."""
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            runs.append(executor.submit(func, *args).result())
+    seconds = min(run[0] for run in runs)
+    return {
+        "wall_seconds": round(seconds, 4),
+        "sections": runs[0][1],
+        "setup_rss_mb": round(max(run[2] for run in runs), 1),
+        "peak_rss_mb": round(max(run[3] for run in runs), 1),
+    }
+
+
+def run_suite(args):
+    spec = DocumentSpec(heading_density=args.heading_density, fonts=tuple(args.fonts), columns=args.columns)
+    results = {}
+    for pages in args.pages:
+        pdf_spec = DocumentSpec(**dict(vars(spec), pages=pages, toc_pages=2 if pages >= 100 else 0))
+        print(f"[1a] {pages} pages: generating...", end=" ", flush=True)
+        pdf_path = cached_document(os.path.join(args.corpus_dir, "pdfs"), pdf_spec)
+        print("running...", end=" ", flush=True)
+        result = measure(_run_outline, pdf_path, repeat=args.repeat)
+        result.update(pages=pages, documents=1)
+        results[f"outline/{pages}p"] = _with_rates(result)
+        print(_summary(result))
+
+    collection_root = os.path.join(args.corpus_dir, "collections")
+    doc_spec = DocumentSpec(**dict(vars(spec), pages=args.doc_pages))
+    for documents in args.documents:
+        name = f"Collection Synthetic {documents}x{doc_spec.key()}"
+        print(f"[1b] {documents} documents: generating...", end=" ", flush=True)
+        make_collection(collection_root, name, documents, doc_spec)
+        print("running...", end=" ", flush=True)
+        result = measure(_run_collection, collection_root, name, args.backend, args.model, args.onnx_dir,
+                         repeat=args.repeat)
+        result.update(pages=documents * args.doc_pages, documents=documents)
+        results[f"collection/{documents}d"] = _with_rates(result)
+        print(_summary(result))
+    return results
+
+
+def _with_rates(result):
+    seconds = max(result["wall_seconds"], 1e-9)
+    result["pages_per_second"] = round(result["pages"] / seconds, 1)
+    result["sections_per_second"] = round(result["sections"] / seconds, 1)
+    return result
+
+
+def _summary(result):
+    return (f"{result['wall_seconds']:.2f}s, {result['pages_per_second']} pages/s, "
+            f"{result['sections_per_second']} sections/s, peak RSS {result['peak_rss_mb']} MB")
+
+
+def environment(args):
+    import fitz
+    import numpy as np
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pymupdf": fitz.VersionBind,
+        "numpy": np.__version__,
+        "backend": args.backend,
+        "model": args.model,
+        "repeat": args.repeat,
+    }
+
+
+def compare(baseline, results, threshold, min_seconds):
+    """Lists the regressions of ``results`` against ``baseline`` beyond ``threshold`` (a fraction).
+
+    Times below ``min_seconds`` in the baseline are too noisy to judge and
+    are skipped. Cases missing from either side are not compared.
+    """
+    regressions = []
+    for case, result in results.items():
+        before = baseline.get(case)
+        if before is None:
+            continue
+        for metric in GUARDED_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None or (metric == "wall_seconds" and old < min_seconds):
+                continue
+            if new > old * (1 + threshold):
+                regressions.append(f"{case}: {metric} {old} -> {new} (+{new / old - 1:.0%})")
+        if before.get("sections") != result["sections"]:
+            print(f"Note: {case} found {result['sections']} sections, the baseline {before.get('sections')}.")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark both challenges on synthetic PDFs.")
+    parser.add_argument("--tier", choices=sorted(TIERS), default="small",
+                        help="Size tiers to run: small for a quick check, full for up to 10,000 pages "
+                             "and 5,000 documents.")
+    parser.add_argument("--pages", type=int, nargs="+", help="Challenge 1a PDF sizes, overriding the tier.")
+    parser.add_argument("--documents", type=int, nargs="+",
+                        help="Challenge 1b collection sizes, overriding the tier (0 to skip 1b).")
+    parser.add_argument("--doc-pages", type=int, default=8, help="Pages of each collection document.")
+    parser.add_argument("--heading-density", type=float, default=0.3)
+    parser.add_argument("--fonts", nargs=2, default=["helv", "hebo"], metavar=("BODY", "HEADING"))
+    parser.add_argument("--columns", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest counts.")
+    parser.add_argument("--backend", choices=["torch", "onnx", "onnx-int8"], default="torch")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Model name or path for Challenge 1b.")
+    parser.add_argument("--onnx-dir", default=os.path.join(ROOT, "Challenge_1b", "onnx_model"))
+    parser.add_argument("--corpus-dir", default=os.path.join(ROOT, "benchmarks", ".corpus"),
+                        help="Where generated PDFs are kept between runs.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write this run's results.")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against; regressions exit with status 1.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown or memory growth over the baseline, as a fraction.")
+    parser.add_argument("--min-seconds", type=float, default=0.5,
+                        help="Baseline times below this are not checked for regressions.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run's results to --baseline.")
+    args = parser.parse_args()
+
+    tier = TIERS[args.tier]
+    args.pages = [n for n in (args.pages or tier["pages"]) if n > 0]
+    args.documents = [n for n in (args.documents or tier["documents"]) if n > 0]
+
+    report = {"environment": environment(args), "results": run_suite(args)}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to '{args.output}'.")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline '{args.baseline}' updated.")
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline["results"], report["results"], args.threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against '{args.baseline}'.")
@@ -0,0 +1,65 @@
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from run_benchmarks import peak_rss_mb
+from synthetic_pdfs import DocumentSpec, cached_document
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _process(pdf_path, output_dir, stream):
+    """Runs Challenge 1a on one PDF; returns the process's peak RSS in MB."""
+    sys.path.insert(0, os.path.join(ROOT, "Challenge_1a"))
+    from process_pdfs import process_file
+
+    _, status, message = process_file(Path(pdf_path), Path(output_dir), stream=stream)
+    if status != "success":
+        raise RuntimeError(message)
+    return peak_rss_mb()
+
+
+def measure_peak_rss(pdf_path, output_dir, stream):
+    """Peak RSS in MB of processing ``pdf_path`` in a fresh process."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(_process, pdf_path, output_dir, stream).result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that --stream keeps Challenge 1a's peak memory flat as page count grows.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 1000, 3000])
+    parser.add_argument("--max-growth-mb", type=float, default=32,
+                        help="Largest allowed peak RSS growth in stream mode from the smallest to the largest document.")
+    parser.add_argument("--corpus-dir", default=os.path.join(ROOT, "benchmarks", ".corpus", "pdfs"))
+    args = parser.parse_args()
+
+    pages = sorted(args.pages)
+    peaks = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in pages:
+            pdf_path = cached_document(args.corpus_dir, DocumentSpec(pages=n, toc_pages=2))
+            outputs = {}
+            for stream in (False, True):
+                outputs[stream] = os.path.join(tmp, f"{n}-{'stream' if stream else 'default'}")
+                os.makedirs(outputs[stream])
+                peaks[n, stream] = measure_peak_rss(pdf_path, outputs[stream], stream)
+            print(f"{n:>6} pages: default {peaks[n, False]:7.1f} MB, --stream {peaks[n, True]:7.1f} MB")
+            name = f"{Path(pdf_path).stem}.json"
+            if not filecmp.cmp(os.path.join(outputs[False], name), os.path.join(outputs[True], name), shallow=False):
+                failures.append(f"{n} pages: --stream output differs from the default mode")
+
+    growth = peaks[pages[-1], True] - peaks[pages[0], True]
+    print(f"--stream peak RSS grew {growth:.1f} MB from {pages[0]} to {pages[-1]} pages "
+          f"(default mode: {peaks[pages[-1], False] - peaks[pages[0], False]:.1f} MB).")
+    if growth > args.max_growth_mb:
+        failures.append(f"--stream peak RSS grew {growth:.1f} MB, more than {args.max_growth_mb:g} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
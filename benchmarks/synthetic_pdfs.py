@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import random
+from dataclasses import asdict, dataclass
+
+import fitz
+
+WORDS = (
+    "analysis approach budget city coast course data design document energy form guide hotel layout market "
+    "method model network office option page plan policy process project quality recipe region report result "
+    "review sample schedule section service signature source strategy summary system table task team travel "
+    "update value version workflow"
+).split()
+
+BODY_SIZE = 10
+HEADING_SIZES = {1: 18, 2: 14, 3: 12}
+LINE_GAP = 1.35
+MARGIN = 72
+
+
+@dataclass
+class DocumentSpec:
+    """Shape of one synthetic PDF.
+
+    ``heading_density`` is the chance that a paragraph opens with a heading;
+    heading levels cycle H1 > H2 > H3 with "1.", "1.1" and "1.1.1" numbering
+    when ``numbered``. ``fonts`` are (body, heading) base-14 font names, and
+    ``toc_pages`` table-of-contents pages follow the title page.
+    """
+    pages: int = 10
+    heading_density: float = 0.3
+    fonts: tuple = ("helv", "hebo")
+    toc_pages: int = 0
+    columns: int = 1
+    numbered: bool = True
+    seed: int = 0
+
+    def key(self):
+        body, heading = self.fonts
+        return (f"p{self.pages}-h{self.heading_density:g}-{body}-{heading}-toc{self.toc_pages}"
+                f"-c{self.columns}-{'n' if self.numbered else 'u'}-s{self.seed}")
+
+
+class _Writer:
+    """Places lines top to bottom across columns and pages.
+
+    Lines are collected in one TextWriter per page and written when the page
+    is done, which is far faster than inserting them one by one.
+    """
+
+    def __init__(self, doc, spec):
+        self.doc = doc
+        self.spec = spec
+        self.page = None
+        self.text = None
+        self.fonts = {}
+        self.column = spec.columns
+        self.y = 0
+
+    def _column_box(self):
+        width = self.page.rect.width - 2 * MARGIN
+        column_width = (width - (self.spec.columns - 1) * 18) / self.spec.columns
+        x0 = MARGIN + self.column * (column_width + 18)
+        return x0, column_width
+
+    def new_page(self):
+        self.flush()
+        self.page = self.doc.new_page()
+        self.text = fitz.TextWriter(self.page.rect)
+        self.column = 0
+        self.y = MARGIN
+
+    def flush(self):
+        if self.text is not None:
+            self.text.write_text(self.page)
+            self.text = None
+
+    def _advance(self, height):
+        if self.page is None or self.y + height > self.page.rect.height - MARGIN:
+            self.column += 1
+            if self.page is None or self.column >= self.spec.columns:
+                self.new_page()
+            self.y = MARGIN
+
+    def line(self, text, size, font):
+        height = size * LINE_GAP
+        self._advance(height)
+        x0, _ = self._column_box()
+        if font not in self.fonts:
+            self.fonts[font] = fitz.Font(font)
+        self.text.append((x0, self.y + size), text, font=self.fonts[font], fontsize=size)
+        self.y += height
+
+    def paragraph(self, words, size, font):
+        _, column_width = self._column_box() if self.page is not None else (0, 400 / self.spec.columns)
+        per_line = max(4, int(column_width / (size * 0.5)))
+        line = []
+        for word in words:
+            if line and len(" ".join(line + [word])) > per_line:
+                self.line(" ".join(line), size, font)
+                line = []
+            line.append(word)
+        if line:
+            self.line(" ".join(line), size, font)
+        self.y += size * 0.8
+
+
+def _heading_text(rng, level, counters, numbered):
+    counters[level - 1] += 1
+    for deeper in range(level, len(counters)):
+        counters[deeper] = 0
+    title = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+    if not numbered:
+        return title
+    number = ".".join(str(max(1, n)) for n in counters[:level])
+    return f"{number}{'.' if level == 1 else ''} {title}"
+
+
+def make_document(path, spec):
+    """Writes a synthetic PDF for ``spec``; returns (pages, headings) written."""
+    rng = random.Random(spec.seed)
+    body_font, heading_font = spec.fonts
+    doc = fitz.open()
+    writer = _Writer(doc, spec)
+
+    writer.new_page()
+    title = " ".join(rng.choice(WORDS).capitalize() for _ in range(4))
+    writer.line(title, 24, heading_font)
+    writer.paragraph(rng.choices(WORDS, k=60), BODY_SIZE, body_font)
+
+    # Headings are planned up front so the TOC can list them with page numbers.
+    outline, counters, level = [], [0, 0, 0], 0
+    body_pages = max(1, spec.pages - 1 - spec.toc_pages)
+    paragraphs_per_page = 6 * spec.columns
+    for _ in range(body_pages * paragraphs_per_page):
+        heading = None
+        if rng.random() < spec.heading_density:
+            level = 1 if level == 0 else rng.choice([max(1, level - 1), level, min(3, level + 1)])
+            heading = (level, _heading_text(rng, level, counters, spec.numbered))
+        outline.append((heading, rng.choices(WORDS, k=rng.randint(25, 60))))
+
+    for toc_page in range(spec.toc_pages):
+        writer.new_page()
+        writer.line("Table of Contents", HEADING_SIZES[1], heading_font)
+        entries = [h for h, _ in outline if h][toc_page * 40:(toc_page + 1) * 40] or [(1, "Overview")] * 6
+        for i, (entry_level, text) in enumerate(entries):
+            writer.line(f"{'  ' * (entry_level - 1)}{text} .......... {2 + spec.toc_pages + i // 8}", BODY_SIZE, body_font)
+
+    writer.new_page()
+    headings = 0
+    for heading, words in outline:
+        if len(doc) > spec.pages:
+            break
+        if heading:
+            heading_level, text = heading
+            writer.line(text, HEADING_SIZES[heading_level], heading_font)
+            headings += 1
+        writer.paragraph(words, BODY_SIZE, body_font)
+    while len(doc) < spec.pages:
+        writer.new_page()
+        writer.paragraph(rng.choices(WORDS, k=40), BODY_SIZE, body_font)
+    writer.flush()
+    if len(doc) > spec.pages:
+        doc.delete_pages(from_page=spec.pages, to_page=len(doc) - 1)
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return spec.pages, headings
+
+
+def cached_document(corpus_dir, spec):
+    """Path of the PDF for ``spec`` under ``corpus_dir``, generating it on first use."""
+    path = os.path.join(corpus_dir, f"{spec.key()}.pdf")
+    if not os.path.exists(path):
+        os.makedirs(corpus_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp.pdf"
+        make_document(tmp_path, spec)
+        os.replace(tmp_path, path)
+    return path
+
+
+def make_collection(root, name, documents, spec):
+    """Writes a Challenge 1b collection of ``documents`` PDFs shaped like ``spec``.
+
+    Each document gets its own seed, so their text differs. Returns the
+    collection's directory; an existing complete collection is reused.
+    """
+    folder = os.path.join(root, name)
+    input_path = os.path.join(folder, "challenge1b_input.json")
+    if os.path.exists(input_path):
+        return folder
+    os.makedirs(os.path.join(folder, "PDFs"), exist_ok=True)
+    entries = []
+    for i in range(documents):
+        filename = f"doc{i:05d}.pdf"
+        make_document(os.path.join(folder, "PDFs", filename), DocumentSpec(**dict(asdict(spec), seed=spec.seed + i)))
+        entries.append({"filename": filename, "title": f"Document {i}"})
+    input_data = {
+        "challenge_info": {"challenge_id": "synthetic", "test_case_name": name, "description": "Synthetic benchmark"},
+        "documents": entries,
+        "persona": {"role": "Project Analyst"},
+        "job_to_be_done": {"task": "Summarize the budget and schedule risks across the reports."},
+    }
+    with open(input_path, 'w', encoding='utf-8') as f:
+        json.dump(input_data, f, indent=4)
+    return folder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic PDFs for benchmarking.")
+    parser.add_argument("output", help="PDF path to write.")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--heading-density", type=float, default=0.3)
+    parser.add_argument("--fonts", nargs=2, default=["helv", "hebo"], metavar=("BODY", "HEADING"),
+                        help="Base-14 font names, e.g. helv hebo, tiro tibo, cour cobo.")
+    parser.add_argument("--toc-pages", type=int, default=0)
+    parser.add_argument("--columns", type=int, default=1)
+    parser.add_argument("--unnumbered", dest="numbered", action="store_false")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = DocumentSpec(args.pages, args.heading_density, tuple(args.fonts), args.toc_pages, args.columns,
+                        args.numbered, args.seed)
+    pages, headings = make_document(args.output, spec)
+    print(f"Wrote {args.output}: {pages} pages, {headings} headings.")